@@ -1,26 +1,154 @@
+import argparse
 import base64
 import datetime
 import io
+import json
+import logging
 import sys
+import threading
+import time
 from string import whitespace
+from urllib.parse import urlencode
 
-from dash import Dash, dash_table, dcc, html
+from dash import Dash, DiskcacheManager, ctx, dash_table, dcc, html, no_update
 from dash.dependencies import Input, Output, State
 import dash_bootstrap_components as dbc
+import flask
+import plotly
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
 import pandas as pd
 import numpy as np
 import os
 from collections import OrderedDict
 
-
-app = Dash(external_stylesheets=[dbc.themes.BOOTSTRAP])
+from export import EXPORT_FORMATS, stream_csv, stream_parquet
+from filters import add_region
+from links import (
+    HUB,
+    LINK_COLUMNS,
+    TRACKID,
+    add_links,
+    has_virtual_links,
+    hub_options,
+    with_links,
+)
+from metrics import METRICS, SIZE_BUCKETS, metrics_view, observe_response, timing_header
+from registry import MEMORY_BUDGET, WATCH_INTERVAL, TableRegistry, find_tables
+from serialize import HEAVY_COLUMNS, encode_page, with_previews
+from summary import SUMMARY_COUNTS, SUMMARY_HISTOGRAMS
+from upload import STATUS, upload_view, uploaded_tables
 
 try:
-    file = sys.argv[1]
-    if not ".csv" in file:
-        sys.exit()
-except:
-    sys.exit("Ooops - Start the script with a csv file as first arg")
+    import diskcache
+except ImportError:
+    diskcache = None
+
+
+# upper bound for the serialized initial layout, in bytes
+MAX_LAYOUT_SIZE = 2 * 1024 * 1024
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="MONSDA peak table dashboard")
+    parser.add_argument(
+        "source",
+        help="peak table (.csv/.parquet), a directory of tables or a .json manifest",
+    )
+    parser.add_argument(
+        "-b",
+        "--backend",
+        choices=["pandas", "shared", "sql"],
+        default="pandas",
+        help="keep the table in memory (pandas), attach it from shared memory "
+        "(shared) or query it from disk (sql)",
+    )
+    parser.add_argument(
+        "-m",
+        "--memory-budget",
+        type=int,
+        default=MEMORY_BUDGET // 1024**2,
+        help="MB of loaded tables kept in memory before evicting the oldest",
+    )
+    parser.add_argument(
+        "--max-layout-size",
+        type=int,
+        default=MAX_LAYOUT_SIZE,
+        help="refuse to start if the initial layout exceeds this many bytes",
+    )
+    parser.add_argument(
+        "-w",
+        "--watch",
+        type=float,
+        default=WATCH_INTERVAL,
+        help="seconds between checks for changed table files, 0 disables reloading",
+    )
+    parser.add_argument(
+        "-p",
+        "--prefetch",
+        type=int,
+        default=PREFETCH,
+        help="pages sent along on either side of the requested page",
+    )
+    parser.add_argument(
+        "--native-rows",
+        type=int,
+        default=NATIVE_ROWS,
+        help="tables up to this many rows are sorted, filtered and paged in the "
+        "browser, 0 disables it",
+    )
+    parser.add_argument(
+        "--native-bytes",
+        type=int,
+        default=NATIVE_BYTES,
+        help="... and whose file is at most this many bytes",
+    )
+    parser.add_argument(
+        "--progressive",
+        action="store_true",
+        help="send the first page of unsorted queries before the total is counted",
+    )
+    parser.add_argument(
+        "--seq-index",
+        action="store_true",
+        help="build k-gram indexes of the sequence columns for faster substring "
+        "filters (kept next to each table in <table>.seqidx)",
+    )
+    parser.add_argument(
+        "--timing-header",
+        action="store_true",
+        help="add per phase durations of each callback as a Server-Timing header",
+    )
+    parser.add_argument(
+        "-c",
+        "--config",
+        help="MONSDA config to take the HUB and TRACKID options for the links from",
+    )
+    parser.add_argument("--hub", help=f"UCSC hub of the links (default {HUB})")
+    parser.add_argument("--trackid", help=f"track id of the links (default {TRACKID})")
+    parser.add_argument(
+        "--background",
+        action="store_true",
+        help="run table queries as cancellable background callbacks. Each job "
+        "runs in a process of its own: filtered row orders and counts are shared "
+        "through the job cache, but a table not loaded yet is loaded by every job "
+        "- best combined with --backend shared, which only attaches it",
+    )
+    args = parser.parse_args()
+    if args.background and diskcache is None:
+        parser.error(
+            "background callbacks need diskcache (pip install dash[diskcache])"
+        )
+    if not find_tables(args.source):
+        parser.error(f"Ooops - no csv or parquet tables found in {args.source}")
+    if args.config:
+        hub, trackid = hub_options(args.config)
+        args.hub = args.hub or hub
+        args.trackid = args.trackid or trackid
+    return args
+
+
+log = logging.getLogger("monsda_dash")
 
 #############
 # CONSTANTS #
@@ -29,15 +157,42 @@ except:
 # default value for paging
 PAGE_SIZE = 20
 
-df = pd.read_csv(file, index_col=0)
+# pages sent along on either side of the requested one, set by create_app
+PREFETCH = 1
 
-# dictionary that each column assigns a type - for filtering
-DTD = dict(df.dtypes)
-for k, v in DTD.items():
-    if np.issubdtype(v, np.number):
-        DTD[k] = "numeric"
-    else:
-        DTD[k] = "text"
+# tables up to this many rows and file bytes are sent to the browser whole and
+# sorted, filtered and paged by the DataTable itself, set by create_app
+NATIVE_ROWS = 5000
+NATIVE_BYTES = 5 * 1024**2
+
+# send the first page of unsorted queries from an early terminating scan and
+# count the rows in the background, set by create_app
+PROGRESSIVE = False
+
+# how often the page asks for a pending row count, in milliseconds
+COUNT_POLL = 500
+# row counts of recent queries, {(table, version, filter_query): total}
+COUNTS = OrderedDict()
+COUNT_CACHE_SIZE = 256
+_counting = set()
+_count_lock = threading.Lock()
+
+# summaries of recent queries, {(table, version, filter_query): summary}
+SUMMARIES = OrderedDict()
+SUMMARY_CACHE_SIZE = 64
+_summary_lock = threading.Lock()
+
+# where background callbacks keep their jobs and results
+CACHE_DIR = os.environ.get("MONSDA_CACHE_DIR", "cache")
+
+# tables are loaded on first access and evicted again over the memory budget,
+# set up by create_app
+REGISTRY = None
+
+START = time.time()
+
+# how often the page checks for finished uploads, in milliseconds
+UPLOAD_POLL = 3000
 
 ########################
 # DASH LAYOUT ELEMENTS #
@@ -54,8 +209,8 @@ sidebar = html.Div(
             dbc.Col(
                 [
                     dcc.Checklist(
-                        df.keys(),
-                        df.keys(),
+                        [],
+                        [],
                         id="column-selection",
                         style={"font-size": 20},
                         inputStyle={"margin-left": "20px", "margin-right": "20px"},
@@ -71,49 +226,108 @@ sidebar = html.Div(
     ]
 )
 
-form = dbc.Row(
-    [
-        dbc.Col(
-            [html.H4("Columns", className="card-title"), sidebar],
-            width="auto",
-        ),
-        dbc.Col(
-            [
-                html.H4("Number of Entries", className="card-title"),
-                dbc.Input(
-                    id="table-size",
-                    type="number",
-                    value=PAGE_SIZE,
-                    className="mb-3",
-                    disabled=True,
-                ),
-            ],
-            width="auto",
-        ),
-        dbc.Col(
-            [
-                html.H4("Set Paging Size", className="card-title"),
-                dbc.Input(
-                    id="page-size",
-                    type="number",
-                    className="mb-3",
-                    value=PAGE_SIZE,
-                    # style={"width": "50%"},
-                ),
-            ],
-            width="auto",
-        ),
-    ]
-)
 
-data_table = dash_table.DataTable(
-    id="table-sorting-filtering",
-    data=df.to_dict(orient="records"),
-    columns=[
+def make_form(tables):
+    return dbc.Row(
+        [
+            dbc.Col(
+                [
+                    html.H4("Table", className="card-title"),
+                    dcc.Dropdown(
+                        tables,
+                        tables[0],
+                        id="table-selection",
+                        clearable=False,
+                        style={"min-width": "400px"},
+                    ),
+                ],
+                width="auto",
+            ),
+            dbc.Col(
+                [html.H4("Columns", className="card-title"), sidebar],
+                width="auto",
+            ),
+            dbc.Col(
+                [
+                    html.H4("Region", className="card-title"),
+                    dbc.Input(
+                        id="region-search",
+                        type="text",
+                        placeholder="chr1:1,000,000-2,000,000",
+                        debounce=True,
+                        className="mb-3",
+                    ),
+                ],
+                width="auto",
+            ),
+            dbc.Col(
+                [
+                    html.H4("Number of Entries", className="card-title"),
+                    dbc.Input(
+                        id="table-size",
+                        placeholder="counting ...",
+                        type="number",
+                        value=PAGE_SIZE,
+                        className="mb-3",
+                        disabled=True,
+                    ),
+                ],
+                width="auto",
+            ),
+            dbc.Col(
+                [
+                    html.H4("Export", className="card-title"),
+                    dbc.ButtonGroup(
+                        [
+                            dbc.Button(
+                                "csv.gz", id="export-csv", href="", external_link=True
+                            ),
+                            dbc.Button(
+                                "parquet",
+                                id="export-parquet",
+                                href="",
+                                external_link=True,
+                            ),
+                        ],
+                        className="mb-3",
+                    ),
+                ],
+                width="auto",
+            ),
+            dbc.Col(
+                [
+                    html.H4("Upload", className="card-title"),
+                    dbc.Button(
+                        "upload csv", id="upload-button", n_clicks=0, className="mb-1"
+                    ),
+                    html.Div(id="upload-message"),
+                    html.Div(id="upload-status"),
+                ],
+                width="auto",
+            ),
+            dbc.Col(
+                [
+                    html.H4("Set Paging Size", className="card-title"),
+                    dbc.Input(
+                        id="page-size",
+                        type="number",
+                        className="mb-3",
+                        value=PAGE_SIZE,
+                        # style={"width": "50%"},
+                    ),
+                ],
+                width="auto",
+            ),
+        ]
+    )
+
+
+def column_defs(cols, dtypes):
+    return [
         {
             "id": i,
             "name": i,
-            "type": DTD.get(i, "any"),
+            "type": dtypes.get(i, "any"),
             "deletable": True,
             "presentation": "markdown",
         }
@@ -121,16 +335,27 @@ data_table = dash_table.DataTable(
         else {
             "name": i,
             "id": i,
-            "type": DTD.get(i, "any"),
+            "type": dtypes.get(i, "any"),
             "deletable": True,
         }
-        for i in df.columns
-    ],
+        for i in cols
+    ]
+
+
+data_table = dash_table.DataTable(
+    id="table-sorting-filtering",
+    # starts empty - the first page is filled in by update_table
+    data=[],
+    # filled in by update_table once the table is loaded
+    columns=[],
     page_current=0,
     # row_selectable="single",
     page_size=PAGE_SIZE,
     page_action="custom",
     filter_action="custom",
+    # the server side filters match case sensitively, the browser does the same
+    # for tables in native mode
+    filter_options={"case": "sensitive"},
     filter_query="",
     sort_action="custom",
     sort_mode="multi",
@@ -160,147 +385,821 @@ data_table = dash_table.DataTable(
     ],
 )
 
+
+def make_layout(source, tables):
+    return html.Div(
+        [
+            html.Br(),
+            html.H2(f"FILE: {source}"),
+            html.Br(),
+            make_form(tables),
+            dbc.Progress(
+                id="query-progress",
+                value=0,
+                striped=True,
+                animated=True,
+                style={"visibility": "hidden"},
+            ),
+            html.Br(),
+            dbc.Button("show / hide summary", id="summary-button", n_clicks=0),
+            dbc.Button(
+                "show / hide density", id="density-button", n_clicks=0, className="ms-2"
+            ),
+            dbc.Collapse(
+                dcc.Graph(id="summary-graph", config={"displaylogo": False}),
+                id="summary-collapse",
+                is_open=False,
+            ),
+            # peak starts along the genome, a click on a bin searches its region
+            dbc.Collapse(
+                dcc.Graph(id="density-graph", config={"displaylogo": False}),
+                id="density-collapse",
+                is_open=False,
+            ),
+            html.Br(),
+            data_table,
+            # full values of the heavy columns of the clicked row
+            html.Div(id="row-detail", className="mt-3"),
+            dcc.Store(id="page-cache"),
+            dcc.Store(id="page-request"),
+            dcc.Store(id="count-request"),
+            dcc.Store(id="table-count"),
+            dcc.Interval(id="count-poll", interval=COUNT_POLL, disabled=True),
+            dcc.Interval(id="upload-poll", interval=UPLOAD_POLL),
+        ]
+    )
+
+
 #############
 # CALLBACKS #
 #############
 
+SHOW_PAGE_JS = """
+function(page, cache, count, request) {
+    const no_update = window.dash_clientside.no_update;
+    // pages arrive as column arrays, the DataTable wants one object per row
+    const decodePage = (encoded) => {
+        const rows = new Array(encoded.n);
+        for (let i = 0; i < encoded.n; i++) {
+            const row = {};
+            for (let j = 0; j < encoded.c.length; j++) {
+                row[encoded.c[j]] = encoded.d[j][i];
+            }
+            rows[i] = row;
+        }
+        return rows;
+    };
+    if (!cache) {
+        return [no_update, no_update];
+    }
+    const pages = cache.pages;
+    if (cache.native) {
+        // the DataTable pages the whole table itself
+        const triggered = window.dash_clientside.callback_context.triggered;
+        const changed = triggered.some((t) => t.prop_id === "page-cache.data");
+        return [changed ? decodePage(pages[0]) : no_update, no_update];
+    }
+    // the total of a progressive first page arrives later, if at all
+    let total = cache.total;
+    if (total === null && count && count.key === cache.key) {
+        total = count.total;
+    }
+    const last = total === null ? Infinity : Math.max(Math.ceil(total / cache.size) - 1, 0);
+    let missing = pages[page] === undefined;
+    for (let p = Math.max(page - cache.prefetch, 0); p <= Math.min(page + cache.prefetch, last); p++) {
+        missing = missing || pages[p] === undefined;
+    }
+    // ask for the page around here once, until the cache has changed
+    const ask = {page: page, key: cache.key};
+    const asked = request && request.page === page && request.key === cache.key;
+    return [
+        pages[page] === undefined ? no_update : decodePage(pages[page]),
+        missing && !asked ? ask : no_update,
+    ];
+}
+"""
+
+
+# a file input opened on demand - the browser streams the chosen file from
+# disk as the request body instead of base64 encoding it like dcc.Upload
+UPLOAD_JS = """
+function(n_clicks) {
+    if (!n_clicks) {
+        return window.dash_clientside.no_update;
+    }
+    const input = document.createElement("input");
+    input.type = "file";
+    input.accept = ".csv";
+    input.onchange = () => {
+        const file = input.files[0];
+        fetch("/upload?name=" + encodeURIComponent(file.name), {method: "POST", body: file})
+            .then(r => r.json())
+            .then(r => console.log("upload", r));
+    };
+    input.click();
+    return "finished uploads are added to the table list";
+}
+"""
+
+# the Number of Entries box shows the total once it is known; until then the
+# row count is polled for
+SHOW_COUNT_JS = """
+function(cache, count, indices) {
+    const no_update = window.dash_clientside.no_update;
+    if (!cache) {
+        return [no_update, true];
+    }
+    if (cache.native) {
+        // the rows left by the filter of the DataTable
+        return [indices ? indices.length : cache.total, true];
+    }
+    if (cache.total !== null) {
+        return [cache.total, true];
+    }
+    if (count && count.key === cache.key) {
+        return [count.total, true];
+    }
+    return [null, false];
+}
+"""
+
+
+def log_first_request():
+    global START
+    if START is not None:
+        log.info(f"time to first request: {time.time() - START:.2f}s")
+        START = None
+
 
-@app.callback(
-    Output("offcanvas-scrollable", "is_open"),
-    Input("open-offcanvas-scrollable", "n_clicks"),
-    State("offcanvas-scrollable", "is_open"),
-)
 def toggle_offcanvas_scrollable(n1, is_open):
     if n1:
         return not is_open
     return is_open
 
 
-# Filter Operators
-operators = [
-    ["ge ", ">="],
-    ["le ", "<="],
-    ["lt ", "<"],
-    ["gt ", ">"],
-    ["ne ", "!="],
-    ["eq ", "="],
-    ["contains "],
-    ["datestartswith "],
-]
-
-
-def split_filter_part(filter_part):
-    for operator_type in operators:
-        for operator in operator_type:
-            if operator in filter_part:
-                name_part, value_part = filter_part.split(operator, 1)
-                name = name_part[name_part.find("{") + 1 : name_part.rfind("}")]
-
-                value_part = value_part.strip()
-                v0 = value_part[0]
-                if v0 == value_part[-1] and v0 in ("'", '"', "`"):
-                    value = value_part[1:-1].replace("\\" + v0, v0)
-                else:
-                    try:
-                        value = float(value_part)
-                    except ValueError:
-                        value = value_part
-                return name, operator_type[0].strip(), value
-    return [None] * 3
-
-
-@app.callback(
-    Output("table-sorting-filtering", "hidden_columns"),
-    Input("column-selection", "value"),
-    State("column-selection", "options"),
-)
-def hide_cols(col_sel, col_opts):
-    set_dif = set(col_opts).symmetric_difference(set(col_sel))
-    temp_dif = list(set_dif)
-    # cols = df.keys()
-    return temp_dif
-
-
-@app.callback(
-    Output("table-sorting-filtering", "data"),
-    Output("table-sorting-filtering", "columns"),
-    Output("table-size", "value"),
-    Output("table-sorting-filtering", "page_size"),
-    Input("table-sorting-filtering", "page_current"),
-    Input("page-size", "value"),
-    Input("table-sorting-filtering", "sort_by"),
-    Input("table-sorting-filtering", "filter_query"),
-)
+def toggle_collapse(n_clicks, is_open):
+    if n_clicks:
+        return not is_open
+    return is_open
+
+
+def update_summary(filter, table, region, is_open):
+    """Plot the distributions of the rows matching the current filter.
+
+    Only the binned counts are computed and sent, never the rows; they are
+    cached per filter, so going back to an earlier filter costs nothing.
+    """
+    if not is_open or not table:
+        return no_update
+    backend = REGISTRY.get(table)
+    filter = add_region(filter, region)
+    key = (table, getattr(backend, "version", None), filter)
+    with _summary_lock:
+        summary = SUMMARIES.get(key)
+    if summary is None:
+        summary = backend.summary(filter)
+        with _summary_lock:
+            SUMMARIES[key] = summary
+            SUMMARIES.move_to_end(key)
+            while len(SUMMARIES) > SUMMARY_CACHE_SIZE:
+                SUMMARIES.popitem(last=False)
+    return summary_figure(summary)
+
+
+def summary_figure(summary):
+    columns = SUMMARY_HISTOGRAMS + SUMMARY_COUNTS
+    fig = make_subplots(rows=2, cols=len(SUMMARY_HISTOGRAMS), subplot_titles=columns)
+    for i, col in enumerate(columns):
+        row, column = divmod(i, len(SUMMARY_HISTOGRAMS))
+        if col in summary["histograms"]:
+            edges = np.asarray(summary["histograms"][col]["edges"])
+            trace = go.Bar(
+                x=(edges[:-1] + edges[1:]) / 2,
+                y=summary["histograms"][col]["counts"],
+                width=edges[1] - edges[0],
+                name=col,
+            )
+        elif col in summary["counts"]:
+            trace = go.Bar(
+                x=summary["counts"][col]["values"],
+                y=summary["counts"][col]["counts"],
+                name=col,
+            )
+        else:
+            continue
+        fig.add_trace(trace, row=row + 1, col=column + 1)
+    fig.update_layout(
+        title=f"{summary['rows']} rows",
+        showlegend=False,
+        height=600,
+        margin={"t": 80, "b": 40},
+        bargap=0.05,
+    )
+    return fig
+
+
+def visible_range(relayout):
+    """The x range of a zoom or pan, (None, None) for the whole axis and None
+    if the x axis did not change."""
+    if relayout.get("xaxis.autorange"):
+        return None, None
+    if "xaxis.range[0]" in relayout:
+        return relayout["xaxis.range[0]"], relayout["xaxis.range[1]"]
+    if "xaxis.range" in relayout:
+        return tuple(relayout["xaxis.range"])
+    return None
+
+
+def update_density(relayout, table, is_open):
+    """Draw the peak density of the visible part of the genome.
+
+    The bin size follows the zoom level; the counts come from the density
+    pyramid of the table, so every zoom or pan is a slice of it.
+    """
+    if not is_open or not table:
+        return no_update
+    window = None, None
+    if ctx.triggered_id == "density-graph":
+        window = visible_range(relayout or {})
+        if window is None:
+            # e.g. autosize, nothing to redraw
+            return no_update
+    pyramid = REGISTRY.get(table).density()
+    if pyramid is None:
+        return go.Figure(layout={"title": "no chr / peak_merge_start columns"})
+    size, chroms, starts, counts = pyramid.view(*window)
+    offsets = np.array([pyramid.offsets[c] for c in chroms], dtype=np.int64)
+    fig = go.Figure(
+        go.Bar(
+            x=offsets + starts + size / 2,
+            y=counts,
+            width=size,
+            customdata=[
+                [chrom, int(start), int(start) + size - 1]
+                for chrom, start in zip(chroms, starts)
+            ],
+            hovertemplate="%{customdata[0]}:%{customdata[1]:,}-%{customdata[2]:,}"
+            "<br>%{y} peaks<extra></extra>",
+        )
+    )
+    for chrom in pyramid.chroms[1:]:
+        fig.add_vline(pyramid.offsets[chrom], line_width=1, line_color="grey")
+    fig.update_layout(
+        title=f"peak starts per {size:,} bp",
+        height=300,
+        margin={"t": 60, "b": 40},
+        bargap=0,
+        # keeps the zoom of the user when the bins are redrawn
+        uirevision=table,
+        xaxis={
+            "tickvals": [
+                pyramid.offsets[c] + pyramid.lengths[c] / 2 for c in pyramid.chroms
+            ],
+            "ticktext": pyramid.chroms,
+        },
+    )
+    return fig
+
+
+def select_density_bin(click):
+    if not click:
+        return no_update
+    chrom, start, end = click["points"][0]["customdata"]
+    return f"{chrom}:{start:,}-{end:,}"
+
+
+def table_stats():
+    return REGISTRY.summary()
+
+
+def refresh_tables(n_intervals, options):
+    """Add finished uploads to the table list and report running ones."""
+    for name, path in uploaded_tables().items():
+        REGISTRY.add(name, path)
+    names = REGISTRY.names()
+    status = [
+        html.Div(
+            f"{name}: {s['state']}, {s.get('rows', 0)} rows {s.get('error') or ''}"
+        )
+        for name, s in list(STATUS.items())
+    ]
+    return names if names != options else no_update, status
+
+
+def native_mode(table):
+    """Small tables are sorted, filtered and paged by the DataTable itself."""
+    if not NATIVE_ROWS or os.path.getsize(REGISTRY.paths[table]) > NATIVE_BYTES:
+        return False
+    return REGISTRY.get(table).count("") <= NATIVE_ROWS
+
+
+def select_table(table):
+    columns = with_links(REGISTRY.get(table).columns)
+    action = "native" if native_mode(table) else "custom"
+    return columns, columns, 0, action, action, action
+
+
+def view_columns(backend, col_sel, sort_by):
+    """Return the visible columns, the columns to query for them and the sort."""
+    # only the visible columns are serialized for the page
+    visible = [c for c in with_links(backend.columns) if c in set(col_sel)]
+    selected = visible
+    if "links" in visible and has_virtual_links(backend.columns):
+        # links are built for the page only, from the columns they point to
+        selected = [c for c in backend.columns if c in visible or c in LINK_COLUMNS]
+        sort_by = [col for col in sort_by if col["column_id"] != "links"]
+    return visible, selected, sort_by
+
+
 def update_table(
-    page_current,
+    page_request,
     page_size,
     sort_by,
     filter,
+    col_sel,
+    table,
+    region,
+    page_current,
+    cache,
+    progress=None,
 ):
-    filtering_expressions = filter.split(" && ")
-    dff = df
-
-    for filter_part in filtering_expressions:
-        col_name, operator, filter_value = split_filter_part(filter_part)
-        if filter_value:
-            if isinstance(filter_value, (int, float)):
-                if filter_value.is_integer():
-                    filter_value = int(filter_value)
-        if operator in ("eq", "ne", "lt", "le", "gt", "ge"):
-            # these operators match pandas series operator method names
-            dff = dff.loc[getattr(dff[col_name], operator)(filter_value)]
-        elif operator == "contains":
-            if not np.issubdtype(dff[col_name], np.number):
-                filter_value = str(filter_value)
-            dff = dff.loc[dff[col_name].str.contains(filter_value)]
-        elif operator == "datestartswith":
-            # this is a simplification of the front-end filtering logic,
-            # only works with complete fields in standard format
-            dff = dff.loc[dff[col_name].str.startswith(filter_value)]
-
-    if len(sort_by):
-        dff = dff.sort_values(
-            [col["column_id"] for col in sort_by],
-            ascending=[col["direction"] == "asc" for col in sort_by],
-            inplace=False,
-        )
-
-    page = page_current
+    backend = REGISTRY.get(table)
+    if native_mode(table):
+        return native_table(backend, col_sel, table, region, cache, page_size)
+    filter = add_region(filter, region)
     size = page_size
-    columns = [
-        {
-            "name": i,
-            "id": i,
-            "type": DTD.get(i, "any"),
-            "deletable": True,
-            "presentation": "markdown",
-        }
-        if i == "links"
-        else {
-            "name": i,
-            "id": i,
-            "type": DTD.get(i, "any"),
-            "deletable": True,
+    visible, selected, sort_by = view_columns(backend, col_sel, sort_by)
+    # the client side cache is only valid for exactly this view of the table
+    key = json.dumps(
+        [table, getattr(backend, "version", None), filter, sort_by, visible, size]
+    )
+    page = page_current
+    if ctx.triggered_id == "page-request" and page_request:
+        page = page_request["page"]
+    # the requested page plus PREFETCH pages on either side in one query
+    first = max(page - PREFETCH, 0)
+    count = page + PREFETCH - first + 1
+    counted = (table, getattr(backend, "version", None), filter)
+    count_request = no_update
+    if (
+        PROGRESSIVE
+        and first == 0
+        and not sort_by
+        and known_count(backend, counted) is None
+    ):
+        # the first pages in table order, the total follows from count-poll
+        page_df, total = backend.head(filter, size * count, selected)
+        if total is None:
+            count_request = {"key": key, "table": table, "filter": filter}
+            start_count(table, backend, filter)
+    else:
+        page_df, total = backend.query(
+            filter, sort_by, first, size, selected, progress, count
+        )
+    if total is not None:
+        remember_count(backend, counted, total)
+        METRICS.observe("monsda_table_rows", total, SIZE_BUCKETS)
+    if selected != visible:
+        page_df = add_links(page_df, visible, HUB, TRACKID)
+    page_df = with_previews(page_df)
+    pages = {}
+    if cache and cache["key"] == key:
+        # keep what the client already has close to the current page
+        pages = {
+            p: rows
+            for p, rows in cache["pages"].items()
+            if abs(int(p) - page) <= 2 * PREFETCH
         }
-        for i in dff.columns
-    ]
+    with METRICS.phase("serialize"):
+        for i in range(count):
+            rows = page_df.iloc[i * size : (i + 1) * size]
+            if len(rows) or first + i == page:
+                pages[str(first + i)] = encode_page(rows)
+    cache = {
+        "key": key,
+        "pages": pages,
+        "total": total,
+        "size": size,
+        "prefetch": PREFETCH,
+    }
+    # column definitions are only resent when the selection changed
+    if ctx.triggered_id in (None, "column-selection", "table-selection"):
+        columns = column_defs(visible, backend.dtypes)
+    else:
+        columns = no_update
     return (
-        dff.iloc[page * size : (page + 1) * size].to_dict("records"),
+        cache,
         columns,
-        dff.shape[0],
+        count_request,
         page_size,
     )
 
 
+def native_table(backend, col_sel, table, region, cache, page_size):
+    """Send the whole table once, the browser sorts, filters and pages it.
+
+    The region search still runs on the server. Values are sent in full, so
+    the DataTable filters the same values the server would.
+    """
+    visible, selected, _ = view_columns(backend, col_sel, [])
+    key = json.dumps(
+        [table, getattr(backend, "version", None), region, visible, "native"]
+    )
+    if cache and cache["key"] == key:
+        # sorting, filtering and paging happen in the browser
+        return no_update, no_update, no_update, page_size
+    page_df, total = backend.query(add_region("", region), [], 0, NATIVE_ROWS, selected)
+    if selected != visible:
+        page_df = add_links(page_df, visible, HUB, TRACKID)
+    with METRICS.phase("serialize"):
+        pages = {"0": encode_page(page_df)}
+    cache = {
+        "key": key,
+        "pages": pages,
+        "total": total,
+        "size": page_size,
+        "prefetch": PREFETCH,
+        "native": True,
+    }
+    return cache, column_defs(visible, backend.dtypes), no_update, page_size
+
+
+def show_detail(
+    active_cell, page_current, page_size, sort_by, filter, col_sel, table, region
+):
+    """Show the full values of the heavy columns of the clicked row.
+
+    The page only carries previews of them, the row is fetched again by its
+    position in the filtered and sorted table.
+    """
+    # in native mode the table holds the full values already
+    if not active_cell or not table or native_mode(table):
+        return None
+    backend = REGISTRY.get(table)
+    visible, selected, sort_by = view_columns(backend, col_sel, sort_by or [])
+    heavy = [c for c in visible if c in HEAVY_COLUMNS]
+    if not heavy:
+        return None
+    virtual = selected != visible
+    fetch = [c for c in selected if c in heavy or (virtual and c in LINK_COLUMNS)]
+    position = page_current * page_size + active_cell["row"]
+    row_df, _ = backend.query(add_region(filter, region), sort_by, position, 1, fetch)
+    if not len(row_df):
+        return None
+    if virtual:
+        row_df = add_links(row_df, heavy, HUB, TRACKID)
+    row = row_df.iloc[0]
+    children = [html.H5(f"Row {position + 1}")]
+    for col in heavy:
+        value = row[col] if not pd.isna(row[col]) else ""
+        children.append(html.B(col))
+        if col == "links":
+            children.append(dcc.Markdown(value))
+        else:
+            children.append(
+                html.Pre(
+                    value, style={"whiteSpace": "pre-wrap", "wordBreak": "break-all"}
+                )
+            )
+    return children
+
+
+def remember_count(backend, key, total):
+    with _count_lock:
+        COUNTS[key] = total
+        COUNTS.move_to_end(key)
+        while len(COUNTS) > COUNT_CACHE_SIZE:
+            COUNTS.popitem(last=False)
+    if backend.store is not None:
+        # counted by a background job, seen by the server process too
+        backend.store.set(("count", key[-1]), total)
+
+
+def known_count(backend, key):
+    total = COUNTS.get(key)
+    if total is None and backend.store is not None:
+        total = backend.store.get(("count", key[-1]))
+    return total
+
+
+def start_count(table, backend, filter):
+    """Count the rows matching a filter in a background thread, once."""
+    key = (table, getattr(backend, "version", None), filter)
+    if known_count(backend, key) is not None:
+        return
+    with _count_lock:
+        if key in _counting:
+            return
+        _counting.add(key)
+
+    def run():
+        try:
+            with METRICS.callback("row_count"):
+                remember_count(backend, key, backend.count(filter))
+        except Exception:
+            log.exception(f"could not count {filter} in {table}")
+        finally:
+            with _count_lock:
+                _counting.discard(key)
+
+    threading.Thread(target=run, name="row-count", daemon=True).start()
+
+
+def poll_count(n_intervals, request):
+    if not request:
+        return no_update
+    backend = REGISTRY.get(request["table"])
+    key = (request["table"], getattr(backend, "version", None), request["filter"])
+    total = known_count(backend, key)
+    if total is None:
+        # e.g. the first page was served by another worker, or by a background
+        # job whose count thread ended with it
+        start_count(request["table"], backend, request["filter"])
+        return no_update
+    return {"key": request["key"], "total": total}
+
+
+def export_links(filter, sort_by, col_sel, table, region):
+    query = {
+        "table": table,
+        "filter": filter or "",
+        "region": region or "",
+        "sort": json.dumps(sort_by or []),
+        "columns": ",".join(col_sel or []),
+    }
+    return ["/export?" + urlencode({**query, "format": fmt}) for fmt in EXPORT_FORMATS]
+
+
+def export_table():
+    """Stream the filtered and sorted table as gzipped csv or parquet.
+
+    Rows are read and written chunk by chunk, so the memory needed does not
+    grow with the result. An interrupted download can be resumed by passing
+    the number of rows already received as `start`.
+    """
+    args = flask.request.args
+    table = args.get("table", REGISTRY.names()[0])
+    fmt = args.get("format", "csv")
+    if table not in REGISTRY.paths or fmt not in EXPORT_FORMATS:
+        flask.abort(404)
+    backend = REGISTRY.get(table)
+    filter_query = add_region(args.get("filter", ""), args.get("region"))
+    # the virtual links column is sortable in the table but not in the data
+    sort_by = [
+        col
+        for col in json.loads(args.get("sort", "[]"))
+        if col["column_id"] in backend.columns
+    ]
+    selected = args.get("columns", "").split(",")
+    columns = [c for c in backend.columns if c in selected] or backend.columns
+    start = int(args.get("start", 0))
+    chunks = METRICS.stream(
+        backend.iter_chunks(filter_query, sort_by, columns, start), "export_table"
+    )
+    name = os.path.splitext(os.path.basename(table))[0]
+    if fmt == "parquet":
+        body = stream_parquet(chunks, columns)
+        mimetype = "application/vnd.apache.parquet"
+        filename = f"{name}.parquet"
+    else:
+        body = stream_csv(chunks, columns, header=start == 0)
+        mimetype = "application/gzip"
+        filename = f"{name}.csv.gz"
+    return flask.Response(
+        body,
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
+
+
+def update_table_background(set_progress, *args):
+    def progress(step, steps):
+        set_progress((100 * step // steps, f"{step} / {steps}"))
+
+    with METRICS.callback("update_table"):
+        return update_table(*args, progress=progress)
+
+
+def register_callbacks(app, manager=None, timing=False):
+    app.server.before_request(log_first_request)
+    app.server.after_request(observe_response)
+    if timing:
+        app.server.after_request(timing_header)
+    app.server.route("/tables/stats")(table_stats)
+    app.server.route("/export")(export_table)
+    app.server.route("/metrics")(metrics_view)
+    app.server.route("/upload", methods=["POST"])(upload_view)
+    app.callback(
+        Output("offcanvas-scrollable", "is_open"),
+        Input("open-offcanvas-scrollable", "n_clicks"),
+        State("offcanvas-scrollable", "is_open"),
+    )(METRICS.instrument(toggle_offcanvas_scrollable))
+    app.callback(
+        Output("summary-collapse", "is_open"),
+        Input("summary-button", "n_clicks"),
+        State("summary-collapse", "is_open"),
+    )(METRICS.instrument(toggle_collapse))
+    app.callback(
+        Output("density-collapse", "is_open"),
+        Input("density-button", "n_clicks"),
+        State("density-collapse", "is_open"),
+    )(METRICS.instrument(toggle_collapse))
+    app.callback(
+        Output("density-graph", "figure"),
+        Input("density-graph", "relayoutData"),
+        Input("table-selection", "value"),
+        Input("density-collapse", "is_open"),
+    )(METRICS.instrument(update_density))
+    app.callback(
+        Output("region-search", "value"),
+        Input("density-graph", "clickData"),
+    )(METRICS.instrument(select_density_bin))
+    app.callback(
+        Output("summary-graph", "figure"),
+        Input("table-sorting-filtering", "filter_query"),
+        Input("table-selection", "value"),
+        Input("region-search", "value"),
+        Input("summary-collapse", "is_open"),
+    )(METRICS.instrument(update_summary))
+    app.callback(
+        Output("column-selection", "options"),
+        Output("column-selection", "value"),
+        Output("table-sorting-filtering", "page_current"),
+        Output("table-sorting-filtering", "page_action"),
+        Output("table-sorting-filtering", "sort_action"),
+        Output("table-sorting-filtering", "filter_action"),
+        Input("table-selection", "value"),
+    )(METRICS.instrument(select_table))
+    app.callback(
+        Output("export-csv", "href"),
+        Output("export-parquet", "href"),
+        Input("table-sorting-filtering", "filter_query"),
+        Input("table-sorting-filtering", "sort_by"),
+        Input("column-selection", "value"),
+        Input("table-selection", "value"),
+        Input("region-search", "value"),
+    )(METRICS.instrument(export_links))
+    app.clientside_callback(
+        UPLOAD_JS,
+        Output("upload-message", "children"),
+        Input("upload-button", "n_clicks"),
+    )
+    app.callback(
+        Output("table-selection", "options"),
+        Output("upload-status", "children"),
+        Input("upload-poll", "n_intervals"),
+        State("table-selection", "options"),
+    )(METRICS.instrument(refresh_tables))
+    # pages are shown from the client side cache, a page that is not cached
+    # yet (or whose neighbours are not) is requested from update_table
+    app.clientside_callback(
+        SHOW_PAGE_JS,
+        Output("table-sorting-filtering", "data"),
+        Output("page-request", "data"),
+        Input("table-sorting-filtering", "page_current"),
+        Input("page-cache", "data"),
+        Input("table-count", "data"),
+        State("page-request", "data"),
+    )
+    app.clientside_callback(
+        SHOW_COUNT_JS,
+        Output("table-size", "value"),
+        Output("count-poll", "disabled"),
+        Input("page-cache", "data"),
+        Input("table-count", "data"),
+        Input("table-sorting-filtering", "derived_virtual_indices"),
+    )
+    app.callback(
+        Output("row-detail", "children"),
+        Input("table-sorting-filtering", "active_cell"),
+        State("table-sorting-filtering", "page_current"),
+        State("table-sorting-filtering", "page_size"),
+        State("table-sorting-filtering", "sort_by"),
+        State("table-sorting-filtering", "filter_query"),
+        State("column-selection", "value"),
+        State("table-selection", "value"),
+        State("region-search", "value"),
+    )(METRICS.instrument(show_detail))
+    app.callback(
+        Output("table-count", "data"),
+        Input("count-poll", "n_intervals"),
+        State("count-request", "data"),
+    )(METRICS.instrument(poll_count))
+    table_outputs = [
+        Output("page-cache", "data"),
+        Output("table-sorting-filtering", "columns"),
+        Output("count-request", "data"),
+        Output("table-sorting-filtering", "page_size"),
+    ]
+    table_inputs = [
+        Input("page-request", "data"),
+        Input("page-size", "value"),
+        Input("table-sorting-filtering", "sort_by"),
+        Input("table-sorting-filtering", "filter_query"),
+        Input("column-selection", "value"),
+        Input("table-selection", "value"),
+        Input("region-search", "value"),
+        State("table-sorting-filtering", "page_current"),
+        State("page-cache", "data"),
+    ]
+    if manager is None:
+        app.callback(*table_outputs, *table_inputs)(METRICS.instrument(update_table))
+        return
+    # the request returns right away; the renderer polls for the result and
+    # terminates the job of a query that was superseded by a newer one
+    app.callback(
+        *table_outputs,
+        *table_inputs,
+        background=True,
+        manager=manager,
+        interval=250,
+        progress=[
+            Output("query-progress", "value"),
+            Output("query-progress", "label"),
+        ],
+        running=[
+            (
+                Output("query-progress", "style"),
+                {"visibility": "visible"},
+                {"visibility": "hidden"},
+            ),
+        ],
+    )(update_table_background)
+
+
+def check_layout_size(layout, limit):
+    size = len(json.dumps(layout, cls=plotly.utils.PlotlyJSONEncoder))
+    log.info(f"initial layout payload: {size} bytes")
+    if size > limit:
+        sys.exit(f"Ooops - the initial layout is {size} bytes, limit is {limit}")
+
+
+def create_app(
+    source,
+    backend="pandas",
+    memory_budget=MEMORY_BUDGET,
+    max_layout_size=MAX_LAYOUT_SIZE,
+    background=False,
+    watch=WATCH_INTERVAL,
+    timing=False,
+    prefetch=PREFETCH,
+    hub=None,
+    trackid=None,
+    progressive=False,
+    native_rows=NATIVE_ROWS,
+    native_bytes=NATIVE_BYTES,
+    seq_index=False,
+):
+    """Build the dashboard for a table, a directory of tables or a manifest.
+
+    Nothing is loaded here - tables are read on their first request, so the
+    factory is cheap to call in every worker of a WSGI server.
+    """
+    global REGISTRY, PREFETCH, HUB, TRACKID, PROGRESSIVE, NATIVE_ROWS, NATIVE_BYTES
+    PREFETCH = prefetch
+    NATIVE_ROWS = native_rows
+    NATIVE_BYTES = native_bytes
+    PROGRESSIVE = progressive
+    HUB = hub or HUB
+    TRACKID = trackid or TRACKID
+    # background jobs share their results through the cache they are kept in
+    store = diskcache.Cache(CACHE_DIR) if background else None
+    REGISTRY = TableRegistry(
+        find_tables(source), backend, memory_budget, seq_index, store
+    )
+    for name, path in uploaded_tables().items():
+        REGISTRY.add(name, path)
+    if watch:
+        # tables rewritten by the pipeline are reloaded and swapped in
+        REGISTRY.watch(watch)
+    # responses are gzip / brotli compressed if the browser accepts it
+    app = Dash(external_stylesheets=[dbc.themes.BOOTSTRAP], compress=True)
+    app.layout = make_layout(source, REGISTRY.names())
+    check_layout_size(app.layout, max_layout_size)
+    manager = None
+    if background:
+        manager = DiskcacheManager(store)
+    register_callbacks(app, manager, timing)
+    return app
+
+
 if __name__ == "__main__":
-    app.layout = html.Div(
-        [
-            html.Br(),
-            html.H2(f"FILE: {file}"),
-            html.Br(),
-            form,
-            html.Br(),
-            data_table,
-        ]
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args()
+    app = create_app(
+        args.source,
+        args.backend,
+        args.memory_budget * 1024**2,
+        args.max_layout_size,
+        args.background,
+        args.watch,
+        args.timing_header,
+        args.prefetch,
+        args.hub,
+        args.trackid,
+        args.progressive,
+        args.native_rows,
+        args.native_bytes,
+        args.seq_index,
     )
     app.run_server(debug=True)
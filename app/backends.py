@@ -0,0 +1,741 @@
+import glob
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from density import DENSITY_BASE, DensityPyramid
+from filters import is_number, parse_filter, refines
+from metrics import METRICS
+from planner import ClausePlanner
+from region_index import REGION_COLUMNS, build_region_index, parse_region
+from seq_index import build_seq_indexes, seq_index_dir
+from serialize import HEAVY_COLUMNS
+from summary import (
+    SUMMARY_COUNTS,
+    SUMMARY_HISTOGRAMS,
+    bin_edges,
+    cell_numbers,
+    histogram,
+    split_counts,
+)
+from shared import attach_indexes, attach_table
+from sidecar import load_table
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+# rows per chunk when importing a csv into the sqlite fallback database
+SQLITE_IMPORT_CHUNK = 50000
+
+# number of filtered and sorted queries whose row order is kept, and their
+# total rows
+ORDER_CACHE_SIZE = 16
+ORDER_CACHE_ROWS = 10_000_000
+
+# filtered row positions kept for refining them with more clauses, in rows
+REFINE_CACHE_ROWS = 10_000_000
+REFINE_CACHE_SIZE = 32
+
+# rows per chunk of the early terminating scan for a first page
+HEAD_CHUNK = 100_000
+
+# rows per chunk when streaming a result set
+EXPORT_CHUNK = 20000
+
+EMPTY = np.empty(0, dtype=np.int64)
+
+SQL_NUMERIC = ("INT", "REAL", "DOUBLE", "FLOAT", "DECIMAL")
+SQL_OPERATORS = {"eq": "=", "ne": "!=", "lt": "<", "le": "<=", "gt": ">", "ge": ">="}
+
+
+def trim(cache, size, rows):
+    """Drop the oldest entries of an LRU of row arrays over size entries or
+    rows in total, keeping at least the newest one."""
+    while len(cache) > size or (
+        sum(len(v) for v in cache.values()) > rows and len(cache) > 1
+    ):
+        cache.popitem(last=False)
+
+
+def column_types(df):
+    # dictionary that each column assigns a type - for filtering
+    DTD = dict(df.dtypes)
+    for k, v in DTD.items():
+        if pd.api.types.is_numeric_dtype(v):
+            DTD[k] = "numeric"
+        else:
+            DTD[k] = "text"
+    return DTD
+
+
+def compact_strings(df, columns=HEAVY_COLUMNS):
+    """Keep long text columns as one Arrow buffer plus offsets each.
+
+    An object column holds a Python str per cell; the Arrow backed string
+    dtype stores the characters back to back, and the string methods used for
+    filtering work on it unchanged.
+    """
+    if pa is None:
+        return df
+    for col in columns:
+        if (
+            col in df.columns
+            and df[col].dtype == object
+            and pd.api.types.infer_dtype(df[col], skipna=True) == "string"
+        ):
+            df[col] = df[col].astype(pd.StringDtype("pyarrow"))
+    return df
+
+
+class PandasBackend:
+    """Serve a table that is held completely in memory as a DataFrame."""
+
+    def __init__(self, df, seq_index=None, region_index=None):
+        self.df = compact_strings(df)
+        self.columns = list(df.columns)
+        self.dtypes = column_types(df)
+        # optional k-gram indexes over the long sequence columns - for
+        # substring filtering, {column: KGramIndex}
+        self.seq_index = seq_index or {}
+        for col, index in self.seq_index.items():
+            # search the compacted column, the one it was built from can go
+            index.series = self.df[col]
+        self.nbytes = int(df.memory_usage(index=True, deep=True).sum()) + sum(
+            index.nbytes for index in self.seq_index.values()
+        )
+        # sorted interval index per chromosome - for {region} overlaps queries
+        if region_index is None:
+            region_index = build_region_index(df)
+        self.region_index = region_index
+        # per column statistics - for running the cheap, selective clauses first
+        self.planner = ClausePlanner(df, self.seq_index, self.region_index)
+        # ordered row positions of the latest queries
+        self._ordered = OrderedDict()
+        # row positions of the latest clause sets, {frozenset(clauses): positions}
+        self._filtered = OrderedDict()
+        # histogram bins, parsed numbers and factorized values of the summary
+        # columns
+        self._edges = {}
+        self._numbers = {}
+        self._codes = {}
+        # peak counts per genome bin, built on first use
+        self._density = None
+        self._lock = threading.Lock()
+        # cache shared with background callback processes, set by the registry
+        self.store = None
+
+    def positions(self, filter_query, progress=None):
+        """Return the positions of the rows matching filter_query, in order.
+
+        Clauses narrow down an array of row positions, so each one only reads
+        its own column at the surviving rows and no intermediate frames are
+        built.
+        """
+        with METRICS.phase("parse"):
+            clauses = parse_filter(filter_query)
+        key = frozenset(clauses)
+        with METRICS.phase("plan"):
+            # None stands for all rows
+            rows, clauses = self.refine(clauses)
+            clauses = self.planner.order(clauses)
+        with METRICS.phase("filter"):
+            rows = self.apply(clauses, rows, progress=progress)
+        if progress is not None:
+            progress(len(clauses), len(clauses) + 1)
+        if rows is None:
+            rows = np.arange(len(self.df))
+        if key:
+            self.remember(key, rows)
+        return rows
+
+    def refine(self, clauses):
+        """Start from the cached rows of a query the new one narrows down.
+
+        While typing, filters grow clause by clause (A -> A && B) and bounds
+        get tighter ({score} > 10 -> {score} > 100), so the smallest cached
+        result whose clauses are all implied by the new ones is a superset of
+        the answer; only the new or tightened clauses run on its rows.
+        """
+        best, remaining = None, clauses
+        with self._lock:
+            for cached, rows in self._filtered.items():
+                rest = refines(clauses, cached)
+                if rest is not None and (best is None or len(rows) < len(best)):
+                    best, remaining = rows, rest
+        return best, remaining
+
+    def remember(self, key, rows):
+        with self._lock:
+            self._filtered[key] = rows
+            self._filtered.move_to_end(key)
+            trim(self._filtered, REFINE_CACHE_SIZE, REFINE_CACHE_ROWS)
+
+    def index_hits(self, col_name, operator, filter_value):
+        """Sorted row positions of a clause answered from an index, else None."""
+        if operator == "overlaps":
+            region = parse_region(filter_value)
+            if region is None or self.region_index is None:
+                return EMPTY
+            return np.sort(self.region_index.overlaps(*region))
+        if operator == "contains" and col_name in self.seq_index:
+            return self.seq_index[col_name].positions(str(filter_value))
+        return None
+
+    def apply(self, clauses, rows=None, hits=None, progress=None):
+        """Narrow down row positions (None for all rows) clause by clause.
+
+        Index lookups are kept in `hits`, so a scan over several chunks of
+        rows looks each clause up only once.
+        """
+        hits = {} if hits is None else hits
+        for step, (col_name, operator, filter_value) in enumerate(clauses):
+            if progress is not None:
+                # one step per clause, plus one for sorting
+                progress(step, len(clauses) + 1)
+            clause = (col_name, operator, filter_value)
+            if clause not in hits:
+                hits[clause] = self.index_hits(*clause)
+            if hits[clause] is not None:
+                if rows is None:
+                    # no scan at all while nothing else was filtered yet
+                    rows = hits[clause]
+                else:
+                    rows = np.intersect1d(rows, hits[clause], assume_unique=True)
+                continue
+            if col_name not in self.df.columns:
+                continue
+            column = self.df[col_name]
+            if operator == "contains" and not pd.api.types.is_numeric_dtype(column):
+                filter_value = str(filter_value)
+            if rows is not None:
+                column = column.iloc[rows]
+            if operator in ("eq", "ne", "lt", "le", "gt", "ge"):
+                # these operators match pandas series operator method names
+                mask = getattr(column, operator)(filter_value)
+            elif operator == "contains":
+                mask = column.str.contains(filter_value, regex=False, na=False)
+            elif operator == "datestartswith":
+                # this is a simplification of the front-end filtering logic,
+                # only works with complete fields in standard format
+                mask = column.str.startswith(filter_value, na=False)
+            else:
+                continue
+            # missing values of nullable columns compare to NA - no match
+            mask = mask.to_numpy(dtype=bool, na_value=False)
+            rows = np.flatnonzero(mask) if rows is None else rows[mask]
+        return rows
+
+    def head(self, filter_query, rows, columns=None):
+        """Return the first `rows` matching rows in table order.
+
+        The table is scanned chunk by chunk and the scan stops as soon as
+        enough rows matched, so a selective filter on a big table answers
+        without filtering all of it. Also returns the total if the scan
+        reached the end of the table, None otherwise.
+        """
+        clauses = self.planner.order(parse_filter(filter_query))
+        found, matched, hits, total = [], 0, {}, None
+        with METRICS.phase("filter"):
+            for start in range(0, len(self.df), HEAD_CHUNK):
+                chunk = np.arange(start, min(start + HEAD_CHUNK, len(self.df)))
+                found.append(self.apply(clauses, chunk, hits))
+                matched += len(found[-1])
+                if matched >= rows:
+                    break
+            else:
+                # the whole table was scanned, the count is known after all
+                total = matched
+        positions = np.concatenate(found)[:rows] if found else EMPTY
+        with METRICS.phase("slice"):
+            page_df = self.rows(positions, columns)
+        return page_df, total
+
+    def count(self, filter_query):
+        return len(self.ordered(filter_query, []))
+
+    def edges(self, col):
+        if col not in self._edges:
+            edges = None
+            if col in self.df.columns and self.dtypes[col] == "numeric":
+                edges = bin_edges(self.df[col].min(), self.df[col].max())
+            elif col in self.df.columns:
+                values = self.cell_numbers(col)[0]
+                if len(values):
+                    edges = bin_edges(values.min(), values.max())
+            self._edges[col] = edges
+        return self._edges[col]
+
+    def cell_numbers(self, col):
+        if col not in self._numbers:
+            self._numbers[col] = cell_numbers(self.df[col])
+        return self._numbers[col]
+
+    def histogram_values(self, col, rows):
+        """The numbers of a histogram column at the given row positions."""
+        if self.dtypes[col] == "numeric":
+            values = self.df[col].iloc[rows].to_numpy(dtype=float, na_value=np.nan)
+            return values[~np.isnan(values)]
+        values, owners = self.cell_numbers(col)
+        keep = np.zeros(len(self.df), dtype=bool)
+        keep[rows] = True
+        return values[keep[owners]]
+
+    def codes(self, col):
+        """Integer codes of a column's values, counted with bincount."""
+        if col not in self._codes:
+            codes, uniques = pd.factorize(self.df[col])
+            dtype = np.int16 if len(uniques) < 2**15 else np.int32
+            self._codes[col] = codes.astype(dtype), np.asarray(uniques, dtype=object)
+        return self._codes[col]
+
+    def summary(self, filter_query):
+        """Histograms and value counts of the rows matching filter_query."""
+        rows = self.positions(filter_query)
+        result = {"rows": len(rows), "histograms": {}, "counts": {}}
+        with METRICS.phase("aggregate"):
+            for col in SUMMARY_HISTOGRAMS:
+                edges = self.edges(col)
+                if edges is None:
+                    continue
+                # equal width bins are counted without sorting the values
+                counts, _ = np.histogram(
+                    self.histogram_values(col, rows),
+                    len(edges) - 1,
+                    range=(edges[0], edges[-1]),
+                )
+                result["histograms"][col] = histogram(edges, counts)
+            for col in SUMMARY_COUNTS:
+                if col not in self.df.columns:
+                    continue
+                codes, uniques = self.codes(col)
+                codes = codes[rows]
+                counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+                result["counts"][col] = split_counts(uniques, counts)
+        return result
+
+    def density(self):
+        """The density pyramid of the peak starts, None without the columns."""
+        chrom, start, _ = REGION_COLUMNS
+        if self._density is None and chrom in self.columns and start in self.columns:
+            starts = self.df[start].to_numpy(dtype=float, na_value=np.nan)
+            bins = np.where(np.isnan(starts), -1, starts // DENSITY_BASE)
+            self._density = DensityPyramid.from_bins(self.df[chrom].to_numpy(), bins)
+        return self._density
+
+    def ordered(self, filter_query, sort_by, progress=None):
+        """Return the positions of the filtered rows in sort order.
+
+        The latest results are cached, so paging through a query only slices
+        the cached positions instead of filtering and sorting again. With a
+        shared store they are also kept there for other processes.
+        """
+        key = (filter_query, json.dumps(sort_by, sort_keys=True))
+        with self._lock:
+            if key in self._ordered:
+                self._ordered.move_to_end(key)
+                return self._ordered[key]
+        rows = None if self.store is None else self.store.get(("ordered",) + key)
+        if rows is None:
+            rows = self.sorted_positions(filter_query, sort_by, progress)
+            if len(self.df) < 2**31:
+                # half the memory of the cached positions
+                rows = rows.astype(np.int32)
+            if self.store is not None:
+                self.store.set(("ordered",) + key, rows)
+        with self._lock:
+            self._ordered[key] = rows
+            trim(self._ordered, ORDER_CACHE_SIZE, ORDER_CACHE_ROWS)
+        return rows
+
+    def cache_bytes(self):
+        """Memory held by the cached row positions, on top of nbytes."""
+        with self._lock:
+            arrays = list(self._ordered.values()) + list(self._filtered.values())
+        # an unsorted result is the same array in both caches
+        return sum({id(a): a.nbytes for a in arrays}.values())
+
+    def sorted_positions(self, filter_query, sort_by, progress=None):
+        rows = self.positions(filter_query, progress)
+        if len(sort_by):
+            # only the sort columns are copied for sorting, on a range index
+            # so the result is the order of the rows, whatever the labels
+            sort_cols = [col["column_id"] for col in sort_by]
+            with METRICS.phase("sort"):
+                order = (
+                    pd.DataFrame(
+                        {
+                            c: self.df[c].iloc[rows].reset_index(drop=True)
+                            for c in sort_cols
+                        }
+                    )
+                    .sort_values(
+                        sort_cols,
+                        ascending=[col["direction"] == "asc" for col in sort_by],
+                    )
+                    .index.to_numpy()
+                )
+                rows = rows[order]
+        return rows
+
+    def rows(self, positions, columns=None):
+        # rows first - selecting both at once takes the columns of all rows
+        return self.df.iloc[positions][self.columns if columns is None else columns]
+
+    def query(
+        self, filter_query, sort_by, page, size, columns=None, progress=None, count=1
+    ):
+        rows = self.ordered(filter_query, sort_by, progress)
+        with METRICS.phase("slice"):
+            page_df = self.rows(rows[page * size : (page + count) * size], columns)
+        return page_df, len(rows)
+
+    def iter_chunks(self, filter_query, sort_by, columns=None, start=0, chunk=None):
+        """Yield the filtered, sorted rows as DataFrames of `chunk` rows."""
+        chunk = chunk or EXPORT_CHUNK
+        rows = self.ordered(filter_query, sort_by)
+        for offset in range(start, len(rows), chunk):
+            yield self.rows(rows[offset : offset + chunk], columns)
+
+
+def records(rows, columns):
+    # without columns the query selects NULL, only the number of rows counts
+    if not columns:
+        return pd.DataFrame(index=range(len(rows)))
+    return pd.DataFrame.from_records(rows, columns=columns)
+
+
+def quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+class SQLBackend:
+    """Serve a table straight from disk through an embedded SQL engine.
+
+    The table is imported once per version into a database next to it - a
+    DuckDB one, or without DuckDB a sqlite one filled chunk by chunk - so a
+    backend keeps answering from its own snapshot while the pipeline
+    rewrites the file and a reload swaps in the next one. The
+    filter_query, sort_by and paging of the DataTable are pushed down into a
+    LIMIT/OFFSET query plus a separate COUNT.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # the table stays on disk
+        self.nbytes = 0
+        self._edges = {}
+        self._density = None
+        self._local = threading.local()
+        self.store = None
+        if duckdb is not None:
+            self.engine = "duckdb"
+            # the open connection keeps this version even once it is replaced
+            self._con = duckdb.connect(self._import_duckdb(path), read_only=True)
+            info = self._con.execute("DESCRIBE peaks").fetchall()
+            # the unnamed first csv column is the pandas index
+            if not path.endswith(".parquet"):
+                info = info[1:]
+            types = {row[0]: row[1] for row in info}
+        else:
+            if path.endswith(".parquet"):
+                raise ValueError("reading parquet files needs duckdb")
+            self.engine = "sqlite"
+            self.db = self._import_csv(path)
+            with sqlite3.connect(self.db) as con:
+                info = con.execute("PRAGMA table_info(peaks)").fetchall()
+            types = {row[1]: row[2] for row in info}
+        self.columns = [c for c in types if c != "__index_level_0__"]
+        self.dtypes = {
+            c: "numeric" if any(t in types[c].upper() for t in SQL_NUMERIC) else "text"
+            for c in self.columns
+        }
+
+    def cache_bytes(self):
+        # results are not cached, the engine has its own buffers
+        return 0
+
+    def _import_duckdb(self, path):
+        # one file per version - DuckDB hands out the database already open
+        # under a path, which would be the old version after a reload
+        stat = os.stat(path)
+        db = f"{path}.{stat.st_mtime_ns}-{stat.st_size}.duckdb"
+        if os.path.exists(db):
+            return db
+        if path.endswith(".parquet"):
+            source = f"read_parquet('{path}')"
+        else:
+            source = f"read_csv_auto('{path}', header=true, nullstr='NA')"
+        tmp = f"{db}.{os.getpid()}.tmp"
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        con = duckdb.connect(tmp)
+        try:
+            con.execute(f"CREATE TABLE peaks AS SELECT * FROM {source}")
+        finally:
+            con.close()
+        os.replace(tmp, db)
+        # older versions go, backends still reading them keep their open file
+        for old in glob.glob(glob.escape(path) + ".*.duckdb"):
+            if old != db:
+                os.remove(old)
+        return db
+
+    def _import_csv(self, path):
+        db = path + ".sqlite"
+        if os.path.exists(db) and os.path.getmtime(db) >= os.path.getmtime(path):
+            return db
+        tmp = db + ".tmp"
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        with sqlite3.connect(tmp) as con:
+            for chunk in pd.read_csv(path, index_col=0, chunksize=SQLITE_IMPORT_CHUNK):
+                chunk.to_sql("peaks", con, if_exists="append", index=False)
+        os.replace(tmp, db)
+        return db
+
+    def _cursor(self):
+        if self.engine == "duckdb":
+            return self._con.cursor()
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = self._local.con = sqlite3.connect(self.db)
+        return con.cursor()
+
+    def where(self, filter_query):
+        clauses = []
+        params = []
+        for col_name, operator, filter_value in parse_filter(filter_query):
+            if operator == "overlaps":
+                region = parse_region(filter_value)
+                if region is None or not all(c in self.columns for c in REGION_COLUMNS):
+                    clauses.append("FALSE")
+                    continue
+                chrom, start, end = (quote(c) for c in REGION_COLUMNS)
+                clauses.append(f"{chrom} = ?")
+                params.append(region[0])
+                if np.isfinite(region[1]):
+                    clauses.append(f"{start} <= ? AND {end} >= ?")
+                    params.extend([region[2], region[1]])
+                continue
+            if col_name not in self.columns:
+                continue
+            col = quote(col_name)
+            if operator in SQL_OPERATORS:
+                if self.dtypes[col_name] == "text":
+                    # typed numbers compare to the text of text columns
+                    filter_value = str(filter_value)
+                elif not is_number(filter_value):
+                    # text never equals or orders against a number - as in
+                    # pandas, everything differs from it
+                    if operator != "ne":
+                        clauses.append("FALSE")
+                    continue
+                clauses.append(f"{col} {SQL_OPERATORS[operator]} ?")
+                params.append(filter_value)
+            elif operator == "contains":
+                clauses.append(f"instr(CAST({col} AS VARCHAR), ?) > 0")
+                params.append(str(filter_value))
+            elif operator == "datestartswith":
+                clauses.append(f"instr(CAST({col} AS VARCHAR), ?) = 1")
+                params.append(str(filter_value))
+        if not clauses:
+            return "", params
+        return " WHERE " + " AND ".join(clauses), params
+
+    def order_by(self, sort_by):
+        terms = [
+            quote(col["column_id"])
+            + (" ASC" if col["direction"] == "asc" else " DESC")
+            + " NULLS LAST"
+            for col in sort_by
+            if col["column_id"] in self.columns
+        ]
+        return " ORDER BY " + ", ".join(terms) if terms else ""
+
+    def query(
+        self, filter_query, sort_by, page, size, columns=None, progress=None, count=1
+    ):
+        columns = self.columns if columns is None else columns
+        with METRICS.phase("parse"):
+            where, params = self.where(filter_query)
+        select = ", ".join(quote(c) for c in columns) or "NULL"
+        cur = self._cursor()
+        if progress is not None:
+            progress(0, 2)
+        with METRICS.phase("filter"):
+            total = cur.execute(
+                f"SELECT COUNT(*) FROM peaks{where}", params
+            ).fetchone()[0]
+        if progress is not None:
+            progress(1, 2)
+        # sorting happens inside the engine, together with the paging
+        with METRICS.phase("slice"):
+            cur.execute(
+                f"SELECT {select} FROM peaks{where}{self.order_by(sort_by)}"
+                " LIMIT ? OFFSET ?",
+                params + [size * count, page * size],
+            )
+            page_df = records(cur.fetchall(), columns)
+        return page_df, total
+
+    def head(self, filter_query, rows, columns=None):
+        """Return the first `rows` matching rows, without counting."""
+        columns = self.columns if columns is None else columns
+        with METRICS.phase("parse"):
+            where, params = self.where(filter_query)
+        select = ", ".join(quote(c) for c in columns) or "NULL"
+        with METRICS.phase("slice"):
+            cur = self._cursor()
+            cur.execute(f"SELECT {select} FROM peaks{where} LIMIT ?", params + [rows])
+            page_df = records(cur.fetchall(), columns)
+        return page_df, (len(page_df) if len(page_df) < rows else None)
+
+    def count(self, filter_query):
+        where, params = self.where(filter_query)
+        cur = self._cursor()
+        return cur.execute(f"SELECT COUNT(*) FROM peaks{where}", params).fetchone()[0]
+
+    def edges(self, col):
+        if col not in self._edges:
+            edges = None
+            if col in self.columns and self.dtypes[col] == "numeric":
+                cur = self._cursor()
+                lo, hi = cur.execute(
+                    f"SELECT MIN({quote(col)}), MAX({quote(col)}) FROM peaks"
+                ).fetchone()
+                edges = bin_edges(lo, hi)
+            elif col in self.columns:
+                values, _ = self.cell_numbers(col, "", [])
+                if len(values):
+                    edges = bin_edges(values.min(), values.max())
+            self._edges[col] = edges
+        return self._edges[col]
+
+    def cell_numbers(self, col, where, params):
+        """The numbers listed in a text column and how many rows list each."""
+        cur = self._cursor()
+        found = cur.execute(
+            f"SELECT {quote(col)}, COUNT(*) FROM peaks{where} GROUP BY {quote(col)}",
+            params,
+        ).fetchall()
+        if not found:
+            return np.empty(0), np.empty(0, dtype=np.int64)
+        cells, counts = zip(*found)
+        values, owners = cell_numbers(pd.Series(cells, dtype=object))
+        return values, np.asarray(counts)[owners]
+
+    def summary(self, filter_query):
+        """Histograms and value counts of the matching rows, grouped in the engine."""
+        where, params = self.where(filter_query)
+        cur = self._cursor()
+        rows = cur.execute(f"SELECT COUNT(*) FROM peaks{where}", params).fetchone()[0]
+        result = {"rows": rows, "histograms": {}, "counts": {}}
+        # sqlite has no FLOOR, its CAST truncates - the same for values >= lo
+        floor = "FLOOR" if self.engine == "duckdb" else ""
+        with METRICS.phase("aggregate"):
+            for col in SUMMARY_HISTOGRAMS:
+                edges = self.edges(col)
+                if edges is None:
+                    continue
+                if self.dtypes[col] != "numeric":
+                    # the cells are parsed here, grouped by their text
+                    values, weights = self.cell_numbers(col, where, params)
+                    counts, _ = np.histogram(
+                        values,
+                        len(edges) - 1,
+                        range=(edges[0], edges[-1]),
+                        weights=weights,
+                    )
+                    result["histograms"][col] = histogram(edges, counts)
+                    continue
+                col_sql = quote(col)
+                present = f"{col_sql} IS NOT NULL"
+                cond = f"{where} AND {present}" if where else f" WHERE {present}"
+                found = cur.execute(
+                    f"SELECT CAST({floor}(({col_sql} - ?) / ?) AS INTEGER) AS bin,"
+                    f" COUNT(*) FROM peaks{cond} GROUP BY bin",
+                    [float(edges[0]), float(edges[1] - edges[0])] + params,
+                ).fetchall()
+                counts = np.zeros(len(edges) - 1, dtype=np.int64)
+                for b, n in found:
+                    # the maximum falls into the last bin
+                    counts[min(max(int(b), 0), len(counts) - 1)] += n
+                result["histograms"][col] = histogram(edges, counts)
+            for col in SUMMARY_COUNTS:
+                if col not in self.columns:
+                    continue
+                found = cur.execute(
+                    f"SELECT {quote(col)}, COUNT(*) FROM peaks{where}"
+                    f" GROUP BY {quote(col)}",
+                    params,
+                ).fetchall()
+                result["counts"][col] = split_counts(
+                    *zip(*found) if found else ((), ())
+                )
+        return result
+
+    def density(self):
+        """The density pyramid of the peak starts, counted in the engine."""
+        if self._density is None and all(c in self.columns for c in REGION_COLUMNS):
+            chrom, start, _ = (quote(c) for c in REGION_COLUMNS)
+            floor = "FLOOR" if self.engine == "duckdb" else ""
+            cur = self._cursor()
+            found = cur.execute(
+                f"SELECT {chrom}, CAST({floor}({start} / ?) AS INTEGER) AS bin,"
+                f" COUNT(*) FROM peaks WHERE {chrom} IS NOT NULL"
+                f" AND {start} IS NOT NULL GROUP BY {chrom}, bin",
+                [float(DENSITY_BASE)],
+            ).fetchall()
+            chroms, bins, counts = zip(*found) if found else ((), (), ())
+            self._density = DensityPyramid.from_bins(chroms, bins, counts)
+        return self._density
+
+    def iter_chunks(self, filter_query, sort_by, columns=None, start=0, chunk=None):
+        """Yield the filtered, sorted rows as DataFrames of `chunk` rows."""
+        chunk = chunk or EXPORT_CHUNK
+        columns = self.columns if columns is None else columns
+        where, params = self.where(filter_query)
+        select = ", ".join(quote(c) for c in columns)
+        # sqlite only knows OFFSET after a LIMIT, -1 meaning none
+        offset = " LIMIT -1 OFFSET ?" if self.engine == "sqlite" else " OFFSET ?"
+        cur = self._cursor()
+        cur.execute(
+            f"SELECT {select} FROM peaks{where}{self.order_by(sort_by)}{offset}",
+            params + [start],
+        )
+        while True:
+            rows = cur.fetchmany(chunk)
+            if not rows:
+                break
+            yield pd.DataFrame.from_records(rows, columns=columns)
+
+
+def open_backend(path, kind="pandas", seq_index=False):
+    """Open a table, with k-gram indexes of its sequence columns if seq_index
+    is set - loaded from next to the table if they are newer than it."""
+    if kind == "sql":
+        return SQLBackend(path)
+    if kind == "shared":
+        # built once and memory-mapped by every worker
+        df = attach_table(path)
+        region_index, indexes = attach_indexes(path, df, seq_index)
+        return PandasBackend(df, indexes, region_index)
+    df = load_table(path)
+    indexes = None
+    if seq_index:
+        indexes = build_seq_indexes(
+            df, seq_index_dir(path), newer_than=os.path.getmtime(path)
+        )
+    return PandasBackend(df, indexes)
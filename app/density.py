@@ -0,0 +1,94 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+# bases per bin of the finest level, each coarser level doubles the bin size
+DENSITY_BASE = 10_000
+# most bins drawn for the visible part of the genome
+DENSITY_BINS = 1000
+
+
+def natural_key(name):
+    # SM_V7_2 before SM_V7_10
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", name)]
+
+
+class DensityPyramid:
+    """Peak counts per chromosome bin at every resolution.
+
+    Level 0 counts the peaks starting in each DENSITY_BASE bin, level n sums
+    pairs of bins of level n - 1, up to a single bin per chromosome. A view
+    of any part of the genome picks the level that fits it into DENSITY_BINS
+    bins and slices it, so zooming never scans the peaks again.
+
+    Chromosomes are laid out one after another on a genome axis, from
+    `offsets`, in natural order of their names.
+    """
+
+    def __init__(self, base):
+        self.chroms = sorted(base, key=natural_key)
+        self.levels = {}
+        self.offsets = {}
+        self.lengths = {}
+        offset = 0
+        for chrom in self.chroms:
+            levels = [base[chrom]]
+            while len(levels[-1]) > 1:
+                counts = levels[-1]
+                if len(counts) % 2:
+                    counts = np.append(counts, 0)
+                levels.append(counts.reshape(-1, 2).sum(axis=1))
+            self.levels[chrom] = levels
+            self.offsets[chrom] = offset
+            self.lengths[chrom] = len(base[chrom]) * DENSITY_BASE
+            offset += self.lengths[chrom]
+        self.length = offset
+
+    @classmethod
+    def from_bins(cls, chroms, bins, counts=None):
+        """Build from the chromosome and level 0 bin of peaks (or of counts)."""
+        codes, names = pd.factorize(pd.Series(chroms, dtype=object))
+        bins = np.asarray(bins, dtype=np.int64)
+        present = (codes >= 0) & (bins >= 0)
+        weights = None if counts is None else np.asarray(counts)[present]
+        codes, bins = codes[present], bins[present]
+        width = int(bins.max()) + 1 if len(bins) else 1
+        grid = np.bincount(
+            codes * width + bins, weights=weights, minlength=len(names) * width
+        )
+        grid = grid.reshape(len(names), width).astype(np.int64)
+        base = {}
+        for code, name in enumerate(names):
+            used = np.flatnonzero(grid[code])
+            if len(used):
+                base[str(name)] = grid[code, : used[-1] + 1]
+        return cls(base)
+
+    def view(self, lo=None, hi=None, bins=DENSITY_BINS):
+        """The non-empty bins overlapping [lo, hi) of the genome axis.
+
+        Returns the bin size and the chromosome, start and count of every bin.
+        """
+        lo = 0 if lo is None else max(int(lo), 0)
+        hi = self.length if hi is None else min(int(hi), self.length)
+        level = 0
+        while (hi - lo) / (DENSITY_BASE << level) > bins:
+            level += 1
+        size = DENSITY_BASE << level
+        chroms, starts, counts = [], [], []
+        for chrom in self.chroms:
+            offset = self.offsets[chrom]
+            levels = self.levels[chrom]
+            values = levels[min(level, len(levels) - 1)]
+            first = max((lo - offset) // size, 0)
+            last = min(-(-(hi - offset) // size), len(values))
+            if first >= last:
+                continue
+            used = first + np.flatnonzero(values[first:last])
+            chroms.extend([chrom] * len(used))
+            starts.append(used * size)
+            counts.append(values[used])
+        starts = np.concatenate(starts) if starts else np.empty(0, dtype=np.int64)
+        counts = np.concatenate(counts) if counts else np.empty(0, dtype=np.int64)
+        return size, chroms, starts, counts
@@ -0,0 +1,84 @@
+import io
+import itertools
+import zlib
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+EXPORT_FORMATS = ("csv", "parquet")
+
+
+def stream_csv(chunks, columns, header=True):
+    """Gzip compress csv chunks on the fly, one DataFrame at a time."""
+    # wbits 31 writes a gzip container instead of a raw zlib stream
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    # an empty result still gets its header line
+    if header:
+        chunks = itertools.chain(chunks, [pd.DataFrame(columns=columns)])
+    for df in chunks:
+        if not header and df.empty:
+            continue
+        data = compressor.compress(df.to_csv(index=False, header=header).encode())
+        header = False
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class StreamSink(io.RawIOBase):
+    """Write-only file that hands out what was written since the last drain.
+
+    The position keeps counting across drains, so the offsets the parquet
+    writer puts into the footer stay valid.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_parquet(chunks, columns):
+    """Write every DataFrame chunk as a parquet row group and stream it out."""
+    sink = StreamSink()
+    writer = None
+    schema = None
+    # an empty result still makes a valid file with all columns
+    chunks = itertools.chain(chunks, [pd.DataFrame(columns=columns)])
+    for df in chunks:
+        if writer is not None and df.empty:
+            continue
+        if writer is None:
+            schema = pa.Schema.from_pandas(df, preserve_index=False)
+            # an all missing first chunk must not pin a column to the null type
+            for i, field in enumerate(schema):
+                if pa.types.is_null(field.type):
+                    schema = schema.set(i, field.with_type(pa.string()))
+            writer = pq.ParquetWriter(sink, schema)
+        writer.write_table(
+            pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+        )
+        yield sink.drain()
+    if writer is not None:
+        writer.close()
+        yield sink.drain()
@@ -0,0 +1,99 @@
+# Filter Operators
+operators = [
+    ["overlaps "],
+    ["ge ", ">="],
+    ["le ", "<="],
+    ["lt ", "<"],
+    ["gt ", ">"],
+    ["ne ", "!="],
+    ["eq ", "="],
+    ["contains "],
+    ["datestartswith "],
+]
+
+
+def split_filter_part(filter_part):
+    for operator_type in operators:
+        for operator in operator_type:
+            if operator in filter_part:
+                name_part, value_part = filter_part.split(operator, 1)
+                name = name_part[name_part.find("{") + 1 : name_part.rfind("}")]
+
+                value_part = value_part.strip()
+                v0 = value_part[0]
+                if v0 == value_part[-1] and v0 in ("'", '"', "`"):
+                    value = value_part[1:-1].replace("\\" + v0, v0)
+                else:
+                    try:
+                        value = float(value_part)
+                    except ValueError:
+                        value = value_part
+                return name, operator_type[0].strip(), value
+    return [None] * 3
+
+
+def parse_filter(filter_query):
+    """Split a DataTable filter_query into (column, operator, value) clauses."""
+    clauses = []
+    for filter_part in (filter_query or "").split(" && "):
+        col_name, operator, filter_value = split_filter_part(filter_part)
+        if operator is None:
+            continue
+        if filter_value:
+            if isinstance(filter_value, (int, float)):
+                if filter_value.is_integer():
+                    filter_value = int(filter_value)
+        clauses.append((col_name, operator, filter_value))
+    return clauses
+
+
+def add_region(filter_query, region):
+    """Append the region search box to a filter_query as an overlaps clause."""
+    if not region or not region.strip():
+        return filter_query
+    clause = "{region} overlaps " + region.strip()
+    return f"{filter_query} && {clause}" if filter_query else clause
+
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def implies(clause, other):
+    """True if every row matching clause also matches other.
+
+    Covers what typing does to a filter: tightened numeric bounds and
+    longer contains / datestartswith patterns.
+    """
+    if clause == other:
+        return True
+    col_name, operator, value = clause
+    other_col, other_op, other_value = other
+    if col_name != other_col:
+        return False
+    if operator == other_op == "contains":
+        return str(other_value) in str(value)
+    if operator == other_op == "datestartswith":
+        return str(value).startswith(str(other_value))
+    if not (is_number(value) and is_number(other_value)):
+        return False
+    if operator in ("gt", "ge", "eq") and other_op in ("gt", "ge"):
+        if operator == "ge" and other_op == "gt" or operator == "eq":
+            return value > other_value if other_op == "gt" else value >= other_value
+        return value >= other_value
+    if operator in ("lt", "le", "eq") and other_op in ("lt", "le"):
+        if operator == "le" and other_op == "lt" or operator == "eq":
+            return value < other_value if other_op == "lt" else value <= other_value
+        return value <= other_value
+    return False
+
+
+def refines(clauses, cached):
+    """Return the clauses still to apply on the rows of a cached clause set.
+
+    None if clauses is not a refinement of cached, i.e. if some cached clause
+    is not implied by any of the new ones.
+    """
+    if not all(any(implies(c, other) for c in clauses) for other in cached):
+        return None
+    return [c for c in clauses if c not in cached]
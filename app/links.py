@@ -0,0 +1,71 @@
+import json
+
+# defaults of the pipeline (scripts/scyphy_to_table.py)
+HUB = "hub_393513_genome"
+TRACKID = "289039575_YBfPH3PcZLRQ4IcjY242DYci9ggv"
+# columns the links are built from
+LINK_COLUMNS = ("chr", "feat_start", "feat_end")
+# bases shown on either side of a feature
+FLANK = 15
+
+UCSC_URL = (
+    "https://genome-euro.ucsc.edu/cgi-bin/hgTracks?db={hub}&lastVirtModeType=default"
+    "&lastVirtModeExtraState=&virtModeType=default&virtMode=0&nonVirtPosition="
+    "&position={chr}%3A{start}%2D{end}&hgsid={trackid}"
+)
+
+
+def hub_options(config):
+    """Find the HUB / TRACKID options anywhere in a MONSDA config file."""
+    with open(config) as fh:
+        stack = [json.load(fh)]
+    options = {}
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            for key in ("HUB", "TRACKID"):
+                if node.get(key):
+                    options.setdefault(key, node[key])
+            stack.extend(node.values())
+    return options.get("HUB"), options.get("TRACKID")
+
+
+def has_virtual_links(columns):
+    """Tables without a stored links column get one built per page."""
+    return "links" not in columns and all(c in columns for c in LINK_COLUMNS)
+
+
+def with_links(columns):
+    """The columns of a table including its virtual links column."""
+    columns = list(columns)
+    if not has_virtual_links(columns):
+        return columns
+    # where the pipeline used to store it
+    at = columns.index("peak_merge_end") + 1 if "peak_merge_end" in columns else 0
+    return columns[:at] + ["links"] + columns[at:]
+
+
+def ucsc_links(chrom, starts, ends, hub=HUB, trackid=TRACKID):
+    """Markdown links for the newline separated features of one peak."""
+    if chrom is None or starts is None or ends is None:
+        return None
+    links = []
+    for s, e in zip(str(starts).split("\n"), str(ends).split("\n")):
+        try:
+            start, end = int(float(s)) - FLANK, int(float(e)) + FLANK
+        except ValueError:
+            continue
+        url = UCSC_URL.format(hub=hub, trackid=trackid, chr=chrom, start=start, end=end)
+        links.append(f"[UCSC Track Hub]({url})")
+    return "\n".join(links)
+
+
+def add_links(page_df, visible, hub=HUB, trackid=TRACKID):
+    """Fill in the links of a page, keeping only the visible columns."""
+    values = page_df[list(LINK_COLUMNS)]
+    values = values.astype(object).where(values.notna(), None)
+    links = [
+        ucsc_links(chrom, start, end, hub, trackid)
+        for chrom, start, end in values.itertuples(index=False)
+    ]
+    return page_df.assign(links=links)[visible]
@@ -0,0 +1,172 @@
+import contextvars
+import functools
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+import flask
+import numpy as np
+
+# upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# upper bounds of the payload / row count histogram buckets
+SIZE_BUCKETS = tuple(10**i for i in range(1, 9))
+# latest observations kept per series for the p50/p95/p99 summaries
+RESERVOIR = 2048
+QUANTILES = (0.5, 0.95, 0.99)
+
+# the callback (or route) running in the current context, labels its phases
+CALLBACK = contextvars.ContextVar("callback", default="other")
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.recent = deque(maxlen=RESERVOIR)
+
+    def observe(self, value):
+        self.counts[int(np.searchsorted(self.buckets, value))] += 1
+        self.sum += value
+        self.count += 1
+        self.recent.append(value)
+
+
+def format_labels(labels, **extra):
+    items = list(labels) + list(extra.items())
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+
+class Metrics:
+    """Prometheus style histograms for callback phases, rows and payloads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = defaultdict(dict)
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series[name]
+            if key not in series:
+                series[key] = Histogram(buckets)
+            series[key].observe(value)
+
+    @contextmanager
+    def callback(self, name):
+        """Label the phases timed inside as phases of callback `name`."""
+        token = CALLBACK.set(name)
+        try:
+            yield
+        finally:
+            CALLBACK.reset(token)
+
+    def stream(self, chunks, name):
+        """Iterate over chunks of a streamed response with its phases labelled.
+
+        The chunks are produced after the view returned, each one is run in
+        a context of its own that carries the label.
+        """
+        context = contextvars.copy_context()
+        context.run(CALLBACK.set, name)
+        while True:
+            try:
+                yield context.run(next, chunks)
+            except StopIteration:
+                return
+
+    @contextmanager
+    def phase(self, name, callback=None):
+        """Time one phase of a callback, e.g. filter, sort or serialize."""
+        callback = callback or CALLBACK.get()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.observe(
+                "monsda_callback_phase_seconds", elapsed, callback=callback, phase=name
+            )
+            if flask.has_request_context():
+                timings = flask.g.setdefault("timings", {})
+                timings[name] = timings.get(name, 0.0) + elapsed
+
+    def instrument(self, fn, name=None):
+        """Wrap a callback so its total latency is recorded."""
+        name = name or fn.__name__
+
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                with self.callback(name):
+                    return fn(*args, **kwargs)
+            finally:
+                self.observe(
+                    "monsda_callback_seconds",
+                    time.perf_counter() - start,
+                    callback=name,
+                )
+
+        return inner
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._series.items()):
+                lines.append(f"# TYPE {name} histogram")
+                for key, hist in series.items():
+                    cumulative = 0
+                    for bound, count in zip(hist.buckets + ("+Inf",), hist.counts):
+                        cumulative += count
+                        lines.append(
+                            f"{name}_bucket{format_labels(key, le=bound)} {cumulative}"
+                        )
+                    lines.append(f"{name}_sum{format_labels(key)} {hist.sum}")
+                    lines.append(f"{name}_count{format_labels(key)} {hist.count}")
+                lines.append(f"# TYPE {name}_recent summary")
+                for key, hist in series.items():
+                    recent = np.asarray(hist.recent)
+                    for q in QUANTILES:
+                        lines.append(
+                            f"{name}_recent{format_labels(key, quantile=q)} "
+                            f"{np.quantile(recent, q)}"
+                        )
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
+
+
+def observe_response(response):
+    """after_request hook - payload size of callback responses."""
+    if flask.request.path.endswith("_dash-update-component"):
+        body = flask.request.get_json(silent=True) or {}
+        output = str(body.get("output", "")).strip(".").split(".")[0]
+        if response.content_length is not None:
+            METRICS.observe(
+                "monsda_response_bytes",
+                response.content_length,
+                SIZE_BUCKETS,
+                output=output,
+            )
+    return response
+
+
+def timing_header(response):
+    """after_request hook - per phase durations as a Server-Timing header."""
+    timings = flask.g.get("timings")
+    if timings:
+        response.headers["Server-Timing"] = ", ".join(
+            f"{name};dur={1000 * seconds:.2f}" for name, seconds in timings.items()
+        )
+    return response
+
+
+def metrics_view():
+    return flask.Response(METRICS.render(), mimetype="text/plain; version=0.0.4")
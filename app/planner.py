@@ -0,0 +1,159 @@
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+
+from region_index import parse_region
+
+# rows sampled per column to estimate substring and prefix matches
+STATS_SAMPLE = 10000
+# bins of the equi-depth histograms of the numeric columns
+HISTOGRAM_BINS = 64
+# relative cost per row of evaluating a clause by scanning a column
+ROW_COST = {
+    "numeric": 1.0,
+    "text": 4.0,
+    "contains": 40.0,
+    "datestartswith": 10.0,
+}
+# clause estimates kept per table
+ESTIMATE_CACHE_SIZE = 256
+# cost per row of a clause answered from an index, only the surviving rows
+# are matched against the index hits
+INDEX_COST = 0.5
+
+
+class ColumnStats:
+    """Statistics of one column, each computed on first use.
+
+    frequencies - share of the rows holding each value (cardinality = its length)
+    histogram   - equi-depth bin bounds of a numeric column
+    sample      - a fixed random sample of a text column for substring matches
+    """
+
+    def __init__(self, series, sample_positions):
+        self.series = series
+        self.rows = max(len(series), 1)
+        self.numeric = pd.api.types.is_numeric_dtype(series)
+        self.sample_positions = sample_positions
+
+    @cached_property
+    def frequencies(self):
+        return self.series.value_counts(dropna=True) / self.rows
+
+    @cached_property
+    def cardinality(self):
+        return len(self.frequencies)
+
+    @cached_property
+    def histogram(self):
+        values = self.series.dropna().to_numpy(dtype=float)
+        if not len(values):
+            return None
+        bounds = np.quantile(values, np.linspace(0, 1, HISTOGRAM_BINS + 1))
+        return bounds, len(values) / self.rows
+
+    @cached_property
+    def sample(self):
+        return self.series.iloc[self.sample_positions].astype(object)
+
+    def below(self, value, inclusive):
+        """Estimated share of the rows below (or at) value."""
+        if self.histogram is None:
+            return 0.0
+        bounds, present = self.histogram
+        fraction = np.interp(value, bounds, np.linspace(0, 1, len(bounds)))
+        if inclusive:
+            fraction += self.equal(value)
+        return min(float(fraction), 1.0) * present
+
+    def equal(self, value):
+        try:
+            return float(self.frequencies.get(value, 0.0))
+        except TypeError:
+            return 0.0
+
+
+class ClausePlanner:
+    """Order filter clauses by their estimated cost and selectivity.
+
+    The clauses of a filter_query are and-ed, so any order gives the same
+    rows; the cheapest and most selective ones are run first, so the
+    expensive ones (substring scans of long text columns) only see the rows
+    that survived. Statistics are kept per column and built on first use.
+    """
+
+    def __init__(self, df, seq_index=None, region_index=None):
+        self.df = df
+        self.seq_index = seq_index or {}
+        self.region_index = region_index
+        rng = np.random.default_rng(0)
+        size = min(STATS_SAMPLE, len(df))
+        self.sample_positions = np.sort(rng.choice(len(df), size, replace=False))
+        self._stats = {}
+        self._estimates = {}
+
+    def stats(self, column):
+        if column not in self._stats:
+            self._stats[column] = ColumnStats(self.df[column], self.sample_positions)
+        return self._stats[column]
+
+    def estimate(self, clause):
+        """Return (selectivity, cost per row) of one (column, operator, value)."""
+        col_name, operator, value = clause
+        rows = max(len(self.df), 1)
+        if operator == "overlaps":
+            region = parse_region(value)
+            if region is None or self.region_index is None:
+                return 0.0, 0.0
+            return len(self.region_index.overlaps(*region)) / rows, INDEX_COST
+        if col_name not in self.df.columns:
+            # skipped by the filter
+            return 1.0, 0.0
+        stats = self.stats(col_name)
+        row_cost = ROW_COST["numeric" if stats.numeric else "text"]
+        if operator in ("eq", "ne"):
+            equal = stats.equal(value)
+            return (equal if operator == "eq" else 1.0 - equal), row_cost
+        if operator in ("lt", "le", "gt", "ge"):
+            if not stats.numeric or not isinstance(value, (int, float)):
+                return 0.5, row_cost
+            below = stats.below(value, inclusive=operator in ("le", "gt"))
+            present = stats.histogram[1] if stats.histogram else 0.0
+            return (below if operator in ("lt", "le") else present - below), row_cost
+        if stats.numeric:
+            return 1.0, row_cost
+        if operator == "contains":
+            value = str(value)
+            index = self.seq_index.get(col_name)
+            # the shortest posting list bounds the hits
+            hits = None if index is None else index.bound(value)
+            if hits is not None:
+                return hits / rows, INDEX_COST
+            matches = stats.sample.str.contains(value, regex=False, na=False)
+            return float(matches.mean()) if len(matches) else 1.0, ROW_COST["contains"]
+        if operator == "datestartswith":
+            matches = stats.sample.str.startswith(str(value), na=False)
+            return (
+                float(matches.mean()) if len(matches) else 1.0,
+                ROW_COST["datestartswith"],
+            )
+        return 1.0, row_cost
+
+    def order(self, clauses):
+        """Sort clauses so that cost / rows removed increases."""
+        if len(clauses) < 2:
+            return clauses
+
+        def rank(clause):
+            # read once - another thread may clear the cache in between
+            estimate = self._estimates.get(clause)
+            if estimate is None:
+                estimate = self.estimate(clause)
+                if len(self._estimates) >= ESTIMATE_CACHE_SIZE:
+                    self._estimates.clear()
+                self._estimates[clause] = estimate
+            selectivity, cost = estimate
+            return cost / max(1.0 - selectivity, 1e-9)
+
+        return sorted(clauses, key=rank)
@@ -0,0 +1,115 @@
+import json
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+REGION_COLUMNS = ("chr", "peak_merge_start", "peak_merge_end")
+
+# arrays of the index, saved as <name>.npy next to bounds.json
+REGION_ARRAYS = ("starts", "ends", "max_ends", "positions")
+
+EMPTY = np.empty(0, dtype=np.int64)
+
+
+def parse_region(text):
+    """Parse 'chr:start-end' (or just 'chr') into (chr, start, end)."""
+    match = re.fullmatch(r"\s*([^:\s]+)(?::([\d,]+)-([\d,]+))?\s*", str(text))
+    if match is None:
+        return None
+    chrom, start, end = match.groups()
+    if start is None:
+        return chrom, -np.inf, np.inf
+    return chrom, int(start.replace(",", "")), int(end.replace(",", ""))
+
+
+class RegionIndex:
+    """Per chromosome interval index over peak_merge_start / peak_merge_end.
+
+    Peaks are sorted by chromosome and start, and a running maximum of the
+    ends per chromosome lets an overlap query skip every peak that ends
+    before the region with a binary search, so only the overlapping peaks
+    themselves are touched. The index is a few flat arrays plus the slice of
+    each chromosome, so it can be saved and memory-mapped by other processes.
+    """
+
+    def __init__(self, bounds, starts, ends, max_ends, positions):
+        self.bounds = bounds
+        self.starts = starts
+        self.ends = ends
+        self.max_ends = max_ends
+        self.positions = positions
+
+    @classmethod
+    def build(cls, df):
+        chrom, start, end = REGION_COLUMNS
+        codes, names = pd.factorize(df[chrom])
+        starts = df[start].to_numpy(dtype=float, na_value=np.nan)
+        ends = df[end].to_numpy(dtype=float, na_value=np.nan)
+        # rows without a chromosome, start or end are never found
+        order = np.lexsort((starts, codes))
+        order = order[
+            (codes[order] >= 0) & ~np.isnan(starts[order]) & ~np.isnan(ends[order])
+        ]
+        codes = codes[order]
+        ends = ends[order]
+        max_ends = ends.copy()
+        bounds = {}
+        for code, first in zip(*np.unique(codes, return_index=True)):
+            last = first + np.count_nonzero(codes == code)
+            bounds[str(names[code])] = (int(first), int(last))
+            max_ends[first:last] = np.maximum.accumulate(ends[first:last])
+        return cls(bounds, starts[order], ends, max_ends, order)
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        for name in REGION_ARRAYS:
+            path = os.path.join(directory, f"{name}.npy")
+            tmp = f"{path}.{os.getpid()}.tmp.npy"
+            np.save(tmp, getattr(self, name))
+            os.replace(tmp, path)
+        # written last, a directory without it is incomplete
+        path = os.path.join(directory, "bounds.json")
+        with open(f"{path}.{os.getpid()}.tmp", "w") as fh:
+            json.dump(self.bounds, fh)
+        os.replace(f"{path}.{os.getpid()}.tmp", path)
+
+    @classmethod
+    def load(cls, directory, newer_than=0):
+        """Memory-map a saved index, None if there is none newer than newer_than."""
+        path = os.path.join(directory, "bounds.json")
+        if not os.path.exists(path) or os.path.getmtime(path) < newer_than:
+            return None
+        with open(path) as fh:
+            bounds = {name: tuple(b) for name, b in json.load(fh).items()}
+        arrays = (
+            np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+            for name in REGION_ARRAYS
+        )
+        return cls(bounds, *arrays)
+
+    def overlaps(self, chrom, start, end):
+        """Return the row positions of all peaks overlapping chrom:start-end."""
+        if chrom not in self.bounds:
+            return EMPTY
+        first, last = self.bounds[chrom]
+        starts = self.starts[first:last]
+        # peaks starting after the region end can not overlap
+        hi = np.searchsorted(starts, end, side="right")
+        # neither can peaks before the first one reaching into the region
+        lo = np.searchsorted(self.max_ends[first : first + hi], start, side="left")
+        hits = self.ends[first + lo : first + hi] >= start
+        return np.asarray(self.positions[first + lo : first + hi][hits])
+
+
+def build_region_index(df):
+    chrom, start, end = REGION_COLUMNS
+    if not all(c in df.columns for c in REGION_COLUMNS):
+        return None
+    if not (
+        pd.api.types.is_numeric_dtype(df[start])
+        and pd.api.types.is_numeric_dtype(df[end])
+    ):
+        return None
+    return RegionIndex.build(df)
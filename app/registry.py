@@ -0,0 +1,227 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from backends import open_backend
+
+log = logging.getLogger(__name__)
+
+TABLE_SUFFIXES = (".csv", ".parquet")
+# default memory budget for all loaded tables, in bytes
+MEMORY_BUDGET = 4 * 1024**3
+# seconds between two checks of the loaded table files for changes
+WATCH_INTERVAL = 2.0
+# seconds results are kept in the store shared with other processes
+STORE_EXPIRE = 3600
+
+
+def file_version(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def find_tables(source):
+    """Map table names to files for a csv/parquet file, a directory or a manifest.
+
+    A directory is searched recursively, so the pipeline layout
+    TABLES/{combo}/peakTable.csv yields one table per combo. A .json manifest
+    maps names to paths relative to the manifest.
+    """
+    if os.path.isdir(source):
+        tables = {}
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            for fl in sorted(files):
+                if fl.endswith(TABLE_SUFFIXES):
+                    path = os.path.join(root, fl)
+                    tables[os.path.relpath(path, source)] = path
+        return tables
+    if source.endswith(".json"):
+        with open(source) as fh:
+            manifest = json.load(fh)
+        base = os.path.dirname(source)
+        return {name: os.path.join(base, path) for name, path in manifest.items()}
+    return {os.path.basename(source): source}
+
+
+class TableStore:
+    """One table's part of a cache shared between processes.
+
+    Background callbacks run in processes of their own, so what they cache
+    in memory is lost with them. Results kept here (a diskcache.Cache) are
+    seen by the server and every later job; the keys carry the table name
+    and version, so a reloaded table never gets the results of the old one.
+    """
+
+    def __init__(self, cache, name, version):
+        self.cache = cache
+        self.prefix = (name, *version)
+
+    def get(self, key):
+        return self.cache.get(self.prefix + key)
+
+    def set(self, key, value):
+        self.cache.set(self.prefix + key, value, expire=STORE_EXPIRE)
+
+
+def new_stats(path):
+    return {
+        "path": path,
+        "loaded": False,
+        "loads": 0,
+        "reloads": 0,
+        "hits": 0,
+        "evictions": 0,
+        "load_seconds": 0.0,
+        "bytes": 0,
+    }
+
+
+class TableRegistry:
+    """Load tables on first access and keep them in a memory-budgeted LRU.
+
+    When the tables held in memory exceed the budget, the least recently used
+    ones are dropped again - they are reloaded (from their sidecar) on their
+    next access.
+
+    Every backend carries the version (mtime, size) of the file it was loaded
+    from. Anything cached per table should be keyed on that version or hang
+    off the backend object, so a reload invalidates it. With a shared `store`
+    every backend also gets a TableStore of it as `backend.store`.
+    """
+
+    def __init__(
+        self, tables, kind="pandas", budget=MEMORY_BUDGET, seq_index=False, store=None
+    ):
+        self.paths = tables
+        self.kind = kind
+        self.seq_index = seq_index
+        self.store = store
+        self.budget = budget
+        self._tables = OrderedDict()
+        self._lock = threading.Lock()
+        self._loading = {name: threading.Lock() for name in tables}
+        self.stats = {name: new_stats(path) for name, path in tables.items()}
+
+    def names(self):
+        return list(self.paths)
+
+    def add(self, name, path):
+        """Register a new table, e.g. an upload; it is loaded on first access."""
+        with self._lock:
+            if name in self.paths:
+                return False
+            self._loading[name] = threading.Lock()
+            self.stats[name] = new_stats(path)
+            self.paths[name] = path
+        log.info(f"added table {name} ({path})")
+        return True
+
+    def memory(self):
+        # the tables plus what their backends cached for recent queries
+        return sum(
+            backend.nbytes + backend.cache_bytes() for backend in self._tables.values()
+        )
+
+    def get(self, name):
+        with self._lock:
+            if name in self._tables:
+                self._tables.move_to_end(name)
+                self.stats[name]["hits"] += 1
+                return self._tables[name]
+        # per table lock, so other tables stay available while this one loads
+        with self._loading[name]:
+            with self._lock:
+                if name in self._tables:
+                    return self._tables[name]
+            backend = self._load(name)
+            with self._lock:
+                self._tables[name] = backend
+                self._evict(keep=name)
+            return backend
+
+    def _load(self, name):
+        start = time.time()
+        version = file_version(self.paths[name])
+        backend = open_backend(self.paths[name], self.kind, self.seq_index)
+        backend.version = version
+        if self.store is not None:
+            backend.store = TableStore(self.store, name, version)
+        elapsed = time.time() - start
+        with self._lock:
+            stats = self.stats[name]
+            stats["loaded"] = True
+            stats["loads"] += 1
+            stats["load_seconds"] += elapsed
+            stats["bytes"] = backend.nbytes
+            stats["version"] = list(version)
+        log.info(f"loaded table {name} ({backend.nbytes} bytes) in {elapsed:.2f}s")
+        return backend
+
+    def reload(self, name):
+        """Load a new version of a table and swap it in.
+
+        Requests that already hold the old backend finish against it; new
+        requests get the new one as soon as it is complete.
+        """
+        with self._loading[name]:
+            backend = self._load(name)
+            with self._lock:
+                # a table evicted in the meantime is simply loaded again later
+                if name not in self._tables:
+                    self.stats[name]["loaded"] = False
+                    return
+                self._tables[name] = backend
+                self.stats[name]["reloads"] += 1
+                self._evict(keep=name)
+        log.info(f"reloaded table {name}")
+
+    def watch(self, interval=WATCH_INTERVAL):
+        thread = threading.Thread(
+            target=self._watch, args=(interval,), name="table-watcher", daemon=True
+        )
+        thread.start()
+        return thread
+
+    def _watch(self, interval):
+        # versions seen on the last check, a file is only reloaded once it
+        # stopped changing - the pipeline may still be writing it
+        pending = {}
+        while True:
+            time.sleep(interval)
+            with self._lock:
+                loaded = {n: backend.version for n, backend in self._tables.items()}
+            for name, version in loaded.items():
+                try:
+                    current = file_version(self.paths[name])
+                except OSError:
+                    continue
+                if current == version:
+                    pending.pop(name, None)
+                elif pending.get(name) != current:
+                    pending[name] = current
+                else:
+                    del pending[name]
+                    try:
+                        self.reload(name)
+                    except Exception:
+                        log.exception(f"could not reload table {name}")
+
+    def _evict(self, keep):
+        while self.memory() > self.budget and len(self._tables) > 1:
+            name = next(n for n in self._tables if n != keep)
+            del self._tables[name]
+            self.stats[name]["loaded"] = False
+            self.stats[name]["evictions"] += 1
+            log.info(f"evicted table {name}")
+
+    def summary(self):
+        with self._lock:
+            return {
+                "budget": self.budget,
+                "memory": self.memory(),
+                "tables": {name: dict(stats) for name, stats in self.stats.items()},
+            }
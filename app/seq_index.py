@@ -0,0 +1,157 @@
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+log = logging.getLogger(__name__)
+
+# columns holding long sequence strings that get a k-gram index, if enabled
+SEQ_INDEX_COLUMNS = ["peak_seq", "feat_seq", "sec_structure"]
+SEQ_INDEX_K = 3
+# directory next to a table the indexes are kept in, e.g. written by the pipeline
+SEQ_INDEX_SUFFIX = ".seqidx"
+# arrays of one index, saved as <column>.k<k>.<name>.npy
+INDEX_ARRAYS = ("grams", "offsets", "positions")
+
+EMPTY = np.empty(0, dtype=np.int64)
+
+
+def seq_index_dir(path):
+    return path + SEQ_INDEX_SUFFIX
+
+
+def gram_codes(data, k):
+    """The k bytes starting at every offset of `data` packed into one integer."""
+    data = data.astype(np.int64)
+    codes = data[: len(data) - k + 1].copy()
+    for j in range(1, k):
+        codes = (codes << 8) | data[j : len(data) - k + 1 + j]
+    return codes
+
+
+class KGramIndex:
+    """Inverted k-gram index over a string column.
+
+    Every k-long substring (of the UTF-8 bytes) of a cell maps to the sorted
+    row positions that contain it. A literal substring search intersects the
+    posting lists of the pattern's k-grams and only verifies the surviving
+    rows. The postings are kept as three flat arrays - the sorted gram codes,
+    their offsets and the row positions - so an index can be saved and
+    memory-mapped again.
+    """
+
+    def __init__(self, series, grams, offsets, positions, k=SEQ_INDEX_K):
+        self.series = series
+        self.grams = grams
+        self.offsets = offsets
+        self.positions_ = positions
+        self.k = k
+        self.nbytes = int(grams.nbytes + offsets.nbytes + positions.nbytes)
+
+    @classmethod
+    def build(cls, series, k=SEQ_INDEX_K):
+        encoded = [v.encode() if isinstance(v, str) else b"" for v in series]
+        rows = len(encoded)
+        lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=rows)
+        data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        owner = np.repeat(np.arange(rows, dtype=np.int64), lengths)
+        # grams starting at each byte that end within the same cell
+        starts = np.flatnonzero(np.arange(len(data)) + k <= np.cumsum(lengths)[owner])
+        codes, owner = gram_codes(data, k)[starts], owner[starts]
+        # hash the few distinct grams to ranks, then a stable sort by rank keeps
+        # the rows ascending within each gram
+        ids, grams = pd.factorize(codes, sort=True)
+        order = np.argsort(ids.astype(np.min_scalar_type(len(grams))), kind="stable")
+        ids, owner = ids[order], owner[order]
+        # one entry per (gram, row)
+        keep = np.ones(len(ids), dtype=bool)
+        keep[1:] = (ids[1:] != ids[:-1]) | (owner[1:] != owner[:-1])
+        ids, owner = ids[keep], owner[keep]
+        offsets = np.searchsorted(ids, np.arange(len(grams) + 1)).astype(np.int64)
+        dtype = np.int32 if rows < 2**31 else np.int64
+        return cls(series, grams.astype(np.int64), offsets, owner.astype(dtype), k)
+
+    def save(self, directory, column):
+        os.makedirs(directory, exist_ok=True)
+        for name in INDEX_ARRAYS:
+            path = os.path.join(directory, f"{column}.k{self.k}.{name}.npy")
+            tmp = f"{path}.{os.getpid()}.tmp.npy"
+            np.save(tmp, getattr(self, "positions_" if name == "positions" else name))
+            os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, directory, column, series, k=SEQ_INDEX_K, newer_than=0):
+        """Memory-map a saved index, None if there is none newer than the table."""
+        paths = [
+            os.path.join(directory, f"{column}.k{k}.{name}.npy")
+            for name in INDEX_ARRAYS
+        ]
+        if not all(
+            os.path.exists(p) and os.path.getmtime(p) >= newer_than for p in paths
+        ):
+            return None
+        grams, offsets, positions = (np.load(p, mmap_mode="r") for p in paths)
+        return cls(series, grams, offsets, positions, k)
+
+    def posting(self, code):
+        i = np.searchsorted(self.grams, code)
+        if i == len(self.grams) or self.grams[i] != code:
+            return EMPTY
+        return self.positions_[self.offsets[i] : self.offsets[i + 1]]
+
+    def postings(self, pattern):
+        """The posting lists of the k-grams of a pattern, None if it is too short."""
+        data = np.frombuffer(pattern.encode(), dtype=np.uint8)
+        if len(data) < self.k:
+            return None
+        codes = np.unique(gram_codes(data, self.k))
+        return sorted((self.posting(code) for code in codes), key=len)
+
+    def bound(self, pattern):
+        """Upper bound of the rows containing `pattern`, None if it is too short."""
+        lists = self.postings(pattern)
+        return None if lists is None else len(lists[0])
+
+    def candidates(self, pattern):
+        # patterns shorter than k can not be narrowed down - scan everything
+        lists = self.postings(pattern)
+        if lists is None:
+            return None
+        rows = np.asarray(lists[0], dtype=np.int64)
+        for other in lists[1:]:
+            if not len(rows):
+                break
+            rows = np.intersect1d(rows, other, assume_unique=True)
+        return rows
+
+    def positions(self, pattern):
+        """Return the sorted row positions of all rows containing `pattern`."""
+        rows = self.candidates(pattern)
+        values = self.series if rows is None else self.series.iloc[rows]
+        hits = values.str.contains(pattern, regex=False, na=False)
+        hits = hits.to_numpy(dtype=bool, na_value=False)
+        return np.flatnonzero(hits) if rows is None else rows[hits]
+
+
+def build_seq_indexes(
+    df, directory=None, newer_than=0, columns=SEQ_INDEX_COLUMNS, k=SEQ_INDEX_K
+):
+    """k-gram indexes of the sequence columns, loaded from `directory` if they
+    were saved there after `newer_than` (an mtime), else built and saved."""
+    indexes = {}
+    for col in columns:
+        if col not in df.columns or pd.api.types.is_numeric_dtype(df[col]):
+            continue
+        index = None
+        if directory is not None:
+            index = KGramIndex.load(directory, col, df[col], k, newer_than)
+        if index is None:
+            index = KGramIndex.build(df[col], k)
+            if directory is not None:
+                try:
+                    index.save(directory, col)
+                except OSError as e:
+                    log.warning(f"could not save the {col} index to {directory}: {e}")
+        indexes[col] = index
+    return indexes
@@ -0,0 +1,70 @@
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# numpy dtypes orjson encodes straight from the array buffer
+NUMPY_KINDS = "biuf"
+
+# long text columns sent as a short preview, the full values are shown in the
+# row detail below the table
+HEAVY_COLUMNS = ("peak_seq", "feat_seq", "sec_structure", "peak_profile_all", "links")
+PREVIEW_CHARS = 24
+PREVIEW_MARK = " …"
+
+
+def column_values(series):
+    """A column as an array the response encoder writes, missing values as null."""
+    if (
+        orjson is not None
+        and isinstance(series.dtype, np.dtype)
+        and series.dtype.kind in NUMPY_KINDS
+    ):
+        # NaN goes out as null
+        return np.ascontiguousarray(series.to_numpy())
+    # object, string and nullable columns, pd.NA / NaN / None -> None
+    return series.to_numpy(dtype=object, na_value=None).tolist()
+
+
+def encode_page(page_df):
+    """A page as column arrays instead of one dict per row.
+
+    {"c": column names, "n": rows, "d": one value array per column} - the
+    client turns it back into DataTable records (decodePage in SHOW_PAGE_JS).
+    Dash encodes its responses with orjson when it is installed (the "auto"
+    json engine of plotly), which writes the numeric columns from their
+    buffers, so no per row dicts or Python floats are built on the server.
+    """
+    return {
+        "c": list(page_df.columns),
+        "n": len(page_df),
+        "d": [column_values(page_df[col]) for col in page_df.columns],
+    }
+
+
+def preview(value, width=PREVIEW_CHARS):
+    """The first line of a long cell, cut after width characters."""
+    if not isinstance(value, str):
+        return value
+    first = value.partition("\n")[0]
+    short = first if width is None else first[:width]
+    return short if len(short) == len(value) else short + PREVIEW_MARK
+
+
+def with_previews(page_df):
+    """Replace the heavy columns of a page by their previews."""
+    heavy = [col for col in HEAVY_COLUMNS if col in page_df.columns]
+    if not heavy:
+        return page_df
+    return page_df.assign(
+        **{
+            # a markdown link is only shown whole
+            col: [
+                preview(v, None if col == "links" else PREVIEW_CHARS)
+                for v in page_df[col]
+            ]
+            for col in heavy
+        }
+    )
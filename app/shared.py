@@ -0,0 +1,116 @@
+import contextlib
+import logging
+import os
+import shutil
+
+import pandas as pd
+
+from region_index import RegionIndex, build_region_index
+from seq_index import build_seq_indexes, seq_index_dir
+from sidecar import load_table, plain_dtypes, sidecar_path
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+log = logging.getLogger(__name__)
+
+# directory the Arrow copies of the tables are published to for all workers
+SHM_DIR = os.environ.get("MONSDA_SHM_DIR", "/dev/shm/monsda_dash")
+
+
+def shm_path(path, suffix=".arrow"):
+    name = os.path.abspath(path).strip(os.sep).replace(os.sep, "__")
+    return os.path.join(SHM_DIR, name + suffix)
+
+
+@contextlib.contextmanager
+def locked(path):
+    """Hold an exclusive lock on path + ".lock" across all processes."""
+    os.makedirs(SHM_DIR, exist_ok=True)
+    with open(path + ".lock", "w") as fh:
+        if fcntl is not None:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+        yield
+
+
+def publish(path):
+    """Make sure an Arrow IPC copy of the table is in shared memory.
+
+    The uncompressed feather sidecar is already an Arrow IPC file, so
+    publishing a csv is a file copy, a parquet table is converted once. The
+    workers take turns, so only the first one ever parses the table.
+    """
+    target = shm_path(path)
+    with locked(target):
+        source = path if path.endswith(".parquet") else sidecar_path(path)
+        if source != path and (
+            not os.path.exists(source)
+            or os.path.getmtime(source) < os.path.getmtime(path)
+        ):
+            load_table(path)
+        if os.path.exists(target) and (
+            os.path.getmtime(target) >= os.path.getmtime(source)
+        ):
+            return target
+        tmp = f"{target}.{os.getpid()}.tmp"
+        if source == path:
+            feather.write_feather(pq.read_table(path), tmp, compression="uncompressed")
+        else:
+            shutil.copyfile(source, tmp)
+        os.replace(tmp, target)
+    log.info(f"published {path} to {target}")
+    return target
+
+
+def arrow_types(dtype):
+    # keep strings in their Arrow buffers instead of copying them into objects
+    if dtype in (pa.string(), pa.large_string()):
+        return pd.StringDtype("pyarrow")
+    return None
+
+
+def attach_table(path):
+    """Attach a table published in shared memory without copying it.
+
+    Numeric columns and the Arrow backed string columns are views on the
+    memory-mapped file, so every worker shares the same pages.
+    """
+    if pa is None:
+        return load_table(path)
+    table = feather.read_table(publish(path), memory_map=True)
+    return plain_dtypes(table.to_pandas(split_blocks=True, types_mapper=arrow_types))
+
+
+def attach_indexes(path, df, seq_index=False):
+    """Region and (if seq_index is set) sequence indexes of a published table.
+
+    The first worker builds and saves them, the region index to shared memory
+    and the sequence indexes next to the table; all others memory-map them.
+    Returns (region_index, {column: KGramIndex} or None).
+    """
+    target = shm_path(path)
+    if pa is None or not os.path.exists(target):
+        indexes = build_seq_indexes(df) if seq_index else None
+        return build_region_index(df), indexes
+    with locked(target):
+        directory = shm_path(path, ".regions")
+        region_index = RegionIndex.load(directory, os.path.getmtime(target))
+        if region_index is None:
+            region_index = build_region_index(df)
+            if region_index is not None:
+                region_index.save(directory)
+        indexes = None
+        if seq_index:
+            indexes = build_seq_indexes(
+                df, seq_index_dir(path), newer_than=os.path.getmtime(path)
+            )
+    return region_index, indexes
@@ -0,0 +1,239 @@
+import hashlib
+import json
+import logging
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:
+    pa = None
+
+log = logging.getLogger(__name__)
+
+SIDECAR_SUFFIX = ".feather"
+# schema metadata key holding the signature of the csv the sidecar was built from
+SIDECAR_KEY = b"monsda_source"
+# rows per chunk when converting a csv without loading it as a whole
+CONVERT_CHUNK = 100_000
+# rows used to fix the column types of a chunked conversion
+CONVERT_SAMPLE = 10_000
+
+
+def sidecar_path(path):
+    return path + SIDECAR_SUFFIX
+
+
+def file_hash(path, chunk=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(chunk), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_signature(path):
+    """Return the csv signature stored in a sidecar, None if there is none."""
+    try:
+        with pa.memory_map(path) as source:
+            metadata = pa.ipc.open_file(source).schema.metadata or {}
+    except (OSError, pa.ArrowException):
+        return None
+    if SIDECAR_KEY not in metadata:
+        return None
+    return json.loads(metadata[SIDECAR_KEY])
+
+
+def is_valid(path, signature):
+    """Check a stored signature against the csv by size, mtime and hash.
+
+    The hash is only computed when the mtime changed, so an unchanged csv is
+    accepted without reading it and a touched but identical one still is -
+    its new mtime is then stored, so the next check skips the hash again.
+    """
+    stat = os.stat(path)
+    if signature is None or signature["size"] != stat.st_size:
+        return False
+    if signature["mtime"] == stat.st_mtime_ns:
+        return True
+    if signature["sha256"] != file_hash(path):
+        return False
+    refresh_signature(path, dict(signature, mtime=stat.st_mtime_ns))
+    return True
+
+
+def refresh_signature(path, signature):
+    """Store a new signature in the sidecar of path, keeping its data."""
+    sidecar = sidecar_path(path)
+    tmp = f"{sidecar}.{os.getpid()}.tmp"
+    try:
+        table = feather.read_table(sidecar, memory_map=True)
+        table = table.replace_schema_metadata(
+            with_signature(table.schema, signature).metadata
+        )
+        feather.write_feather(table, tmp, compression="uncompressed")
+        os.replace(tmp, sidecar)
+    except (OSError, pa.ArrowException) as e:
+        log.warning(f"could not update the signature of {sidecar}: {e}")
+
+
+def file_signature(path):
+    stat = os.stat(path)
+    return {
+        "size": stat.st_size,
+        "mtime": stat.st_mtime_ns,
+        "sha256": file_hash(path),
+    }
+
+
+def with_signature(schema, signature):
+    metadata = dict(schema.metadata or {})
+    metadata[SIDECAR_KEY] = json.dumps(signature).encode()
+    return schema.with_metadata(metadata)
+
+
+def write_sidecar(df, path):
+    table = pa.Table.from_pandas(df)
+    table = table.replace_schema_metadata(
+        with_signature(table.schema, file_signature(path)).metadata
+    )
+    # uncompressed, so later loads can memory-map the file
+    tmp = f"{sidecar_path(path)}.{os.getpid()}.tmp"
+    feather.write_feather(table, tmp, compression="uncompressed")
+    os.replace(tmp, sidecar_path(path))
+
+
+def csv_dtypes(sample):
+    """Fix the column types from a sample, so every chunk parses the same way.
+
+    Only columns with values in the sample get a numeric type, a column that
+    is empty throughout it (read as float by pandas) may hold text later on.
+    """
+    dtypes = {}
+    for col in sample.columns:
+        if not sample[col].notna().any():
+            dtypes[col] = "object"
+        elif pd.api.types.is_bool_dtype(sample[col]):
+            dtypes[col] = "boolean"
+        elif pd.api.types.is_integer_dtype(sample[col]):
+            # nullable, a later chunk may have missing values
+            dtypes[col] = "Int64"
+        elif pd.api.types.is_float_dtype(sample[col]):
+            dtypes[col] = "float64"
+        else:
+            dtypes[col] = "object"
+    return dtypes
+
+
+def widened(dtype, values):
+    """The type a column needs to also hold `values` that did not fit `dtype`."""
+    if dtype == "Int64" and pd.api.types.is_numeric_dtype(values):
+        return "float64"
+    return "object"
+
+
+def plain_dtypes(df):
+    """Turn nullable integer columns into numpy ones.
+
+    Chunked conversions keep integer columns nullable, as a later chunk may
+    have missing values. Numpy columns filter, sort and index much faster, so
+    they become int64 again, or float64 if something is missing.
+    """
+    for col in df.columns:
+        dtype = df[col].dtype
+        if pd.api.types.is_extension_array_dtype(dtype) and (
+            pd.api.types.is_integer_dtype(dtype)
+        ):
+            if df[col].hasnans:
+                df[col] = df[col].to_numpy(dtype="float64", na_value=np.nan)
+            else:
+                df[col] = df[col].to_numpy(dtype="int64")
+    return df
+
+
+def convert_csv(path, chunksize=CONVERT_CHUNK, progress=None):
+    """Parse a csv chunk by chunk straight into its sidecar.
+
+    Unlike load_table this never holds more than one chunk of the csv in
+    memory, so it is used for uploads of any size. The column types come
+    from a sample; a later chunk that does not fit them (e.g. text in a
+    column that only held numbers so far) widens the column and starts the
+    conversion over. Returns the row count.
+    """
+    sample = pd.read_csv(path, index_col=0, nrows=CONVERT_SAMPLE)
+    dtypes = csv_dtypes(sample)
+    tmp = f"{sidecar_path(path)}.{os.getpid()}.tmp"
+    try:
+        while True:
+            rows = write_chunks(path, tmp, sample, dtypes, chunksize, progress)
+            if isinstance(rows, int):
+                break
+            col, dtype = rows
+            log.info(f"{path}: column {col} does not fit the sample, read as {dtype}")
+            dtypes[col] = dtype
+        os.replace(tmp, sidecar_path(path))
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return rows
+
+
+def write_chunks(path, tmp, sample, dtypes, chunksize, progress=None):
+    """Write the csv to tmp with the given column types.
+
+    Text columns are read as text, the others are inferred per chunk and
+    cast. Returns the row count, or (column, wider type) for the first
+    column of a chunk that could not be cast.
+    """
+    schema = pa.Schema.from_pandas(sample.astype(dtypes).iloc[:0])
+    # a column missing throughout the sample is still text
+    schema = pa.schema(
+        [f.with_type(pa.string()) if pa.types.is_null(f.type) else f for f in schema],
+        metadata=with_signature(schema, file_signature(path)).metadata,
+    )
+    text = {col: dtype for col, dtype in dtypes.items() if dtype == "object"}
+    rows = 0
+    with pa.ipc.new_file(tmp, schema) as writer:
+        for chunk in pd.read_csv(path, index_col=0, dtype=text, chunksize=chunksize):
+            for col, dtype in dtypes.items():
+                if dtype != "object" and chunk[col].dtype != dtype:
+                    try:
+                        chunk[col] = chunk[col].astype(dtype)
+                    except (TypeError, ValueError):
+                        return col, widened(dtype, chunk[col])
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema))
+            rows += len(chunk)
+            if progress is not None:
+                progress(rows)
+    return rows
+
+
+def load_table(path):
+    """Load a peak table csv, going through its binary sidecar when possible.
+
+    The first load parses the csv and writes an Arrow IPC (feather) file next
+    to it. Later loads memory-map the sidecar as long as it still matches the
+    csv.
+    """
+    start = time.time()
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path)
+    if pa is None:
+        return pd.read_csv(path, index_col=0)
+    sidecar = sidecar_path(path)
+    if os.path.exists(sidecar) and is_valid(path, read_signature(sidecar)):
+        df = plain_dtypes(feather.read_table(sidecar, memory_map=True).to_pandas())
+        log.info(f"loaded {sidecar} in {time.time() - start:.2f}s")
+        return df
+    df = pd.read_csv(path, index_col=0)
+    log.info(f"parsed {path} in {time.time() - start:.2f}s")
+    try:
+        write_sidecar(df, path)
+    except (OSError, pa.ArrowException) as e:
+        log.warning(f"could not write sidecar {sidecar}: {e}")
+    return df
@@ -0,0 +1,53 @@
+import re
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+# columns shown as histograms over fixed bins of the whole table, text columns
+# listing one number per feature count every number
+SUMMARY_HISTOGRAMS = ("score_mean", "pv_min", "minimum_free_energy")
+# columns whose values are counted, cells may list several values
+SUMMARY_COUNTS = ("prot", "cond", "chr")
+SUMMARY_BINS = 40
+# values shown per count panel, the most frequent ones
+SUMMARY_TOP = 20
+
+# separators of the values listed in one cell, e.g. "AtRNL,T4RNL"
+VALUE_SEPARATORS = re.compile(r"[,\n]")
+
+
+def bin_edges(lo, hi, bins=SUMMARY_BINS):
+    """Equal width bins spanning [lo, hi], fixed per table so that the
+    histograms of different filters can be compared."""
+    if lo is None or hi is None or not np.isfinite(lo) or not np.isfinite(hi):
+        return None
+    if lo == hi:
+        hi = lo + 1
+    return np.linspace(lo, hi, bins + 1)
+
+
+def split_counts(values, counts, top=SUMMARY_TOP):
+    """Counts per single value from counts per cell, most frequent first."""
+    totals = Counter()
+    for value, count in zip(values, counts):
+        if count and isinstance(value, str):
+            for part in VALUE_SEPARATORS.split(value):
+                if part.strip():
+                    totals[part.strip()] += int(count)
+    values, counts = zip(*totals.most_common(top)) if totals else ((), ())
+    return {"values": list(values), "counts": list(counts)}
+
+
+def histogram(edges, counts):
+    return {"edges": edges.tolist(), "counts": [int(c) for c in counts]}
+
+
+def cell_numbers(series):
+    """The numbers listed in text cells (e.g. "-36.3\\nNA"), one per feature,
+    and the position of the row each one comes from."""
+    parts = pd.Series(series.to_numpy(), copy=False).str.split(VALUE_SEPARATORS)
+    parts = parts.explode()
+    values = pd.to_numeric(parts, errors="coerce").to_numpy(dtype=float)
+    present = ~np.isnan(values)
+    return values[present], parts.index.to_numpy()[present]
@@ -0,0 +1,102 @@
+import logging
+import os
+import threading
+import time
+
+import flask
+from werkzeug.utils import secure_filename
+
+from sidecar import convert_csv, is_valid, read_signature, sidecar_path
+
+log = logging.getLogger(__name__)
+
+# directory uploaded tables and their sidecars are written to
+UPLOAD_DIR = os.environ.get("MONSDA_UPLOAD_DIR", "uploads")
+# bytes read from the request body at a time
+UPLOAD_CHUNK = 1 << 20
+# uploads show up in the table list under this prefix
+UPLOAD_PREFIX = "uploads/"
+
+# state of the uploads handled by this process, by table name
+STATUS = {}
+_lock = threading.Lock()
+
+
+def set_status(name, **status):
+    with _lock:
+        STATUS.setdefault(name, {}).update(status)
+
+
+def receive(stream, path):
+    """Copy a request body to disk chunk by chunk, never holding it in memory."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.part"
+    size = 0
+    try:
+        with open(tmp, "wb") as fh:
+            for block in iter(lambda: stream.read(UPLOAD_CHUNK), b""):
+                fh.write(block)
+                size += len(block)
+        os.replace(tmp, path)
+    except BaseException:
+        # e.g. the client went away mid upload
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return size
+
+
+def ingest(name, path):
+    """Convert an uploaded csv into its sidecar, run in a background thread."""
+    start = time.time()
+    try:
+        rows = convert_csv(path, progress=lambda rows: set_status(name, rows=rows))
+    except Exception as e:
+        log.exception(f"could not ingest upload {path}")
+        set_status(name, state="failed", error=str(e))
+        return
+    set_status(name, state="done", rows=rows)
+    log.info(f"ingested upload {path} ({rows} rows) in {time.time() - start:.2f}s")
+
+
+def uploaded_tables():
+    """Map table names to the uploads that are completely converted.
+
+    Goes by the files, not STATUS, so every worker picks up an upload no
+    matter which one received it.
+    """
+    if not os.path.isdir(UPLOAD_DIR):
+        return {}
+    tables = {}
+    for fl in sorted(os.listdir(UPLOAD_DIR)):
+        path = os.path.join(UPLOAD_DIR, fl)
+        if fl.endswith(".csv") and os.path.exists(sidecar_path(path)):
+            if is_valid(path, read_signature(sidecar_path(path))):
+                tables[UPLOAD_PREFIX + fl] = path
+    return tables
+
+
+def upload_view():
+    """POST a csv as the raw request body, e.g. curl -T table.csv /upload?name=x.csv
+
+    The body is streamed to UPLOAD_DIR and parsed in the background; the table
+    is listed once its sidecar is written.
+    """
+    fl = secure_filename(flask.request.args.get("name", ""))
+    if not fl.endswith(".csv"):
+        return {"error": "expected a .csv file name"}, 400
+    name = UPLOAD_PREFIX + fl
+    if STATUS.get(name, {}).get("state") in ("receiving", "parsing"):
+        return {"error": f"{name} is already being uploaded"}, 409
+    path = os.path.join(UPLOAD_DIR, fl)
+    set_status(name, state="receiving", rows=0, error=None)
+    try:
+        size = receive(flask.request.stream, path)
+    except Exception as e:
+        set_status(name, state="failed", error=str(e))
+        raise
+    set_status(name, state="parsing", bytes=size)
+    threading.Thread(
+        target=ingest, args=(name, path), name=f"ingest-{fl}", daemon=True
+    ).start()
+    return {"table": name, "state": "parsing", "bytes": size}, 202
@@ -0,0 +1,47 @@
+"""Production entry point for the dashboard.
+
+Serve it with several workers, e.g.
+
+    MONSDA_TABLES=TABLES gunicorn --chdir app -w 4 -b 0.0.0.0:8050 wsgi:server
+
+By default every table is published once as an Arrow file to shared memory
+(MONSDA_SHM_DIR, /dev/shm/monsda_dash) and each worker attaches to it instead
+of holding a private copy. Set MONSDA_BACKGROUND=1 to run table queries as
+background callbacks (jobs kept under MONSDA_CACHE_DIR). Each job is a
+process of its own; row orders and counts are shared through the job cache,
+and the shared backend keeps a job from loading a table again. Uploaded
+tables are kept in MONSDA_UPLOAD_DIR, which all workers need to share. Tables
+of up to MONSDA_NATIVE_ROWS rows and MONSDA_NATIVE_BYTES bytes are sent to the
+browser whole and sorted, filtered and paged there. Set MONSDA_SEQ_INDEX=1 to
+index the sequence columns for substring filters.
+"""
+import logging
+import os
+
+from app_new import NATIVE_BYTES, NATIVE_ROWS, create_app
+from registry import MEMORY_BUDGET, WATCH_INTERVAL
+
+logging.basicConfig(level=logging.INFO)
+
+
+def flag(name):
+    # "0", "false" or unset are off
+    return os.environ.get(name, "").strip().lower() in ("1", "true", "yes", "on")
+
+
+app = create_app(
+    os.environ["MONSDA_TABLES"],
+    backend=os.environ.get("MONSDA_BACKEND", "shared"),
+    memory_budget=int(os.environ.get("MONSDA_MEMORY_BUDGET", MEMORY_BUDGET)),
+    background=flag("MONSDA_BACKGROUND"),
+    watch=float(os.environ.get("MONSDA_WATCH", WATCH_INTERVAL)),
+    timing=flag("MONSDA_TIMING_HEADER"),
+    prefetch=int(os.environ.get("MONSDA_PREFETCH", 1)),
+    hub=os.environ.get("MONSDA_HUB"),
+    trackid=os.environ.get("MONSDA_TRACKID"),
+    progressive=flag("MONSDA_PROGRESSIVE"),
+    native_rows=int(os.environ.get("MONSDA_NATIVE_ROWS", NATIVE_ROWS)),
+    native_bytes=int(os.environ.get("MONSDA_NATIVE_BYTES", NATIVE_BYTES)),
+    seq_index=flag("MONSDA_SEQ_INDEX"),
+)
+server = app.server
@@ -0,0 +1,299 @@
+#!/usr/bin/env python
+"""Microbenchmarks of the update_table callback on synthetic peak tables.
+
+Synthetic tables with the schema of Tables/BBB_test.csv are generated once
+per size (and kept in --data-dir), then every combination of filter, sort
+and page is sent through the real callback with the Flask test client - no
+browser, but the same routing, querying and JSON encoding as in production.
+
+    python bench/bench_update_table.py -r 10000 100000 -o results.json
+    python bench/bench_update_table.py -r 10000 -o new.json --compare old.json
+
+For each case the latency of cold (query cache cleared) and warm runs, the
+peak Python heap during a cold run (tracemalloc) and the response size are
+written to the results file.
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, os.path.join(ROOT, "app"))
+
+import app_new  # noqa: E402
+
+TEMPLATE = os.path.join(ROOT, "Tables", "BBB_test.csv")
+ROWS = [10_000, 100_000, 1_000_000, 10_000_000]
+PAGE_SIZE = 20
+CHROMS = [f"SM_V7_{i}" for i in range(1, 8)] + ["SM_V7_ZW"]
+CHROM_SIZE = 90_000_000
+
+# {name: filter_query}, values are chosen to match part of the synthetic rows
+FILTERS = {
+    "none": "",
+    "eq": "{chr} eq SM_V7_2",
+    "gt": "{score_mean} gt 100",
+    "le": "{pv_min} <= -0.5",
+    "contains": "{prot} contains T4RNL",
+    "seq_contains": "{feat_seq} contains GGA",
+    "overlaps": "{region} overlaps SM_V7_3:10,000,000-40,000,000",
+    "combined": "{chr} eq SM_V7_1 && {score_mean} gt 50 && {prot} contains RNL",
+}
+SORTS = {
+    "none": [],
+    "score_desc": [{"column_id": "score_mean", "direction": "desc"}],
+    "multi": [
+        {"column_id": "chr", "direction": "asc"},
+        {"column_id": "peak_merge_start", "direction": "asc"},
+        {"column_id": "score_mean", "direction": "desc"},
+    ],
+}
+PAGES = ("first", "middle", "last")
+
+TABLE_OUTPUTS = (
+    "..page-cache.data...table-sorting-filtering.columns..."
+    "count-request.data...table-sorting-filtering.page_size.."
+)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "-r", "--rows", type=int, nargs="+", default=ROWS, help="table sizes"
+    )
+    parser.add_argument(
+        "-b", "--backend", choices=["pandas", "shared", "sql"], default="pandas"
+    )
+    parser.add_argument(
+        "-n", "--repeat", type=int, default=5, help="timed runs per case"
+    )
+    parser.add_argument(
+        "-d",
+        "--data-dir",
+        default=os.path.join(BENCH_DIR, "data"),
+        help="where the synthetic tables are kept between runs",
+    )
+    parser.add_argument("-o", "--out", default="bench_results.json")
+    parser.add_argument("-c", "--compare", help="earlier results file to compare to")
+    return parser.parse_args()
+
+
+def synthetic_table(rows, seed=0):
+    """Resample the template rows and randomize positions, scores and p-values."""
+    rng = np.random.default_rng(seed)
+    template = pd.read_csv(TEMPLATE, index_col=0)
+    df = template.iloc[rng.integers(0, len(template), rows)].reset_index(drop=True)
+    length = (df["peak_merge_end"] - df["peak_merge_start"]).to_numpy()
+    start = rng.integers(0, CHROM_SIZE, rows)
+    df["chr"] = rng.choice(CHROMS, rows)
+    df["peak_merge_start"] = start
+    df["peak_merge_end"] = start + length
+    df["peak_all_start"] = start
+    df["peak_all_end"] = start + length
+    df["score_mean"] = rng.lognormal(4, 1.5, rows).round(3)
+    df["score_min"] = (df["score_mean"] * rng.uniform(0, 1, rows)).round()
+    df["score_max"] = (df["score_mean"] * rng.uniform(1, 8, rows)).round()
+    df["pv_min"] = -rng.uniform(0, 1, rows)
+    df["hits_total"] = rng.integers(1, 200, rows)
+    return df[template.columns]
+
+
+def table_path(data_dir, rows):
+    path = os.path.join(data_dir, f"synthetic_{rows}.parquet")
+    if not os.path.exists(path):
+        os.makedirs(data_dir, exist_ok=True)
+        start = time.time()
+        synthetic_table(rows).to_parquet(path)
+        logging.info(f"generated {path} in {time.time() - start:.1f}s")
+    return path
+
+
+def dash_request(client, table, filter_query, sort_by, page):
+    props = [
+        ("page-request", "data", None),
+        ("page-size", "value", PAGE_SIZE),
+        ("table-sorting-filtering", "sort_by", sort_by),
+        ("table-sorting-filtering", "filter_query", filter_query),
+        ("column-selection", "value", list(app_new.REGISTRY.get(table).columns)),
+        ("table-selection", "value", table),
+        ("region-search", "value", None),
+    ]
+    state = [
+        ("table-sorting-filtering", "page_current", page),
+        ("page-cache", "data", None),
+    ]
+    body = {
+        "output": TABLE_OUTPUTS,
+        "outputs": [
+            {"id": o.split(".")[0], "property": o.split(".")[1]}
+            for o in TABLE_OUTPUTS.strip(".").split("...")
+        ],
+        "inputs": [{"id": i, "property": p, "value": v} for i, p, v in props],
+        "state": [{"id": i, "property": p, "value": v} for i, p, v in state],
+        "changedPropIds": ["table-sorting-filtering.filter_query"],
+    }
+    response = client.post("/_dash-update-component", json=body)
+    if response.status_code != 200:
+        raise RuntimeError(response.data.decode()[:500])
+    return response
+
+
+def clear_cache(backend):
+    """Forget every per query result, so a cold run filters and sorts again.
+
+    Per table state (indexes, column statistics) stays, it is built once per
+    load in production too.
+    """
+    # sorted results, filtered rows kept for refining and clause estimates
+    if hasattr(backend, "_ordered"):
+        backend._ordered.clear()
+        backend._filtered.clear()
+        backend.planner._estimates.clear()
+    with app_new._count_lock:
+        app_new.COUNTS.clear()
+
+
+def run_case(client, table, filter_query, sort_by, page, repeat):
+    backend = app_new.REGISTRY.get(table)
+    cold, warm = [], []
+    for _ in range(repeat):
+        clear_cache(backend)
+        start = time.perf_counter()
+        dash_request(client, table, filter_query, sort_by, page)
+        cold.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        response = dash_request(client, table, filter_query, sort_by, page)
+        warm.append(time.perf_counter() - start)
+    clear_cache(backend)
+    tracemalloc.start()
+    dash_request(client, table, filter_query, sort_by, page)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    total = response.get_json()["response"]["page-cache"]["data"]["total"]
+    return {
+        "cold_ms": summarize(cold),
+        "warm_ms": summarize(warm),
+        "peak_bytes": peak,
+        "payload_bytes": len(response.data),
+        "total": total,
+    }
+
+
+def summarize(seconds):
+    ms = [1000 * s for s in seconds]
+    return {"median": statistics.median(ms), "min": min(ms), "max": max(ms)}
+
+
+def page_number(which, total):
+    last = max((total - 1) // PAGE_SIZE, 0)
+    return {"first": 0, "middle": last // 2, "last": last}[which]
+
+
+def bench_size(rows, args):
+    path = table_path(args.data_dir, rows)
+    app = app_new.create_app(path, backend=args.backend, watch=0)
+    client = app.server.test_client()
+    table = app_new.REGISTRY.names()[0]
+    start = time.perf_counter()
+    app_new.REGISTRY.get(table)
+    load = time.perf_counter() - start
+    results = []
+    for fname, filter_query in FILTERS.items():
+        for sname, sort_by in SORTS.items():
+            total = None
+            for which in PAGES:
+                page = 0 if total is None else page_number(which, total)
+                case = run_case(client, table, filter_query, sort_by, page, args.repeat)
+                total = case["total"]
+                case.update(
+                    rows=rows, filter=fname, sort=sname, page=which, page_number=page
+                )
+                results.append(case)
+                logging.info(
+                    f"{rows:>9} {fname:>12} {sname:>10} {which:>6} "
+                    f"cold {case['cold_ms']['median']:8.1f}ms "
+                    f"warm {case['warm_ms']['median']:8.1f}ms "
+                    f"peak {case['peak_bytes'] / 1024**2:7.1f}MB "
+                    f"payload {case['payload_bytes']:>7}B"
+                )
+    return {"rows": rows, "load_seconds": load}, results
+
+
+def case_key(case):
+    return case["rows"], case["filter"], case["sort"], case["page"]
+
+
+def compare(results, old_path):
+    """Print the median cold latency of every case relative to an earlier run."""
+    with open(old_path) as fh:
+        old = {case_key(case): case for case in json.load(fh)["results"]}
+    print(f"{'case':<48} {'old ms':>9} {'new ms':>9} {'ratio':>6}")
+    for case in results:
+        before = old.get(case_key(case))
+        if before is None:
+            continue
+        a, b = before["cold_ms"]["median"], case["cold_ms"]["median"]
+        name = " ".join(str(k) for k in case_key(case))
+        print(f"{name:<48} {a:9.1f} {b:9.1f} {b / a:6.2f}")
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "-C", ROOT, "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    # the per request logging of the app would drown the results
+    for name in ("monsda_dash", "registry", "sidecar", "werkzeug"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+    args = parse_args()
+    tables, results = [], []
+    for rows in args.rows:
+        table, cases = bench_size(rows, args)
+        tables.append(table)
+        results.extend(cases)
+    with open(args.out, "w") as fh:
+        json.dump(
+            {
+                "meta": {
+                    "commit": git_commit(),
+                    "date": datetime.datetime.now().isoformat(timespec="seconds"),
+                    "python": platform.python_version(),
+                    "pandas": pd.__version__,
+                    "backend": args.backend,
+                    "repeat": args.repeat,
+                    "page_size": PAGE_SIZE,
+                },
+                "tables": tables,
+                "results": results,
+            },
+            fh,
+            indent=1,
+        )
+    logging.info(f"wrote {len(results)} results to {args.out}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
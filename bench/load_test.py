@@ -0,0 +1,403 @@
+#!/usr/bin/env python
+"""Load test of the dashboard server with many simulated analysts.
+
+Starts the app locally in each serving mode and lets --sessions concurrent
+sessions click through it: every session loads the layout and callback
+dependencies like a browser does, opens the table and then edits filters,
+toggles sorts, turns pages and hides columns at random. The callback
+requests are built from /_dash-dependencies, so they always match the
+running app, and the stores the browser would send back are sent back.
+
+    python bench/load_test.py -t Tables/BBB_test.csv -s 16 -d 30 -o load.json
+
+Modes: dev (app_new.py, the Flask development server), threaded (one
+gunicorn worker with --threads) and workers (--workers gunicorn processes
+with the shared backend). Everything runs on localhost.
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import random
+import shutil
+import signal
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+APP_DIR = os.path.join(ROOT, "app")
+
+MODES = ("dev", "threaded", "workers")
+HOST = "127.0.0.1"
+# seconds to wait for a server to answer its first request
+STARTUP_TIMEOUT = 120
+
+FILTERS = [
+    "{score_mean} gt 100",
+    "{score_mean} gt 1000",
+    "{chr} eq SM_V7_1",
+    "{chr} eq SM_V7_ZW",
+    "{prot} contains RNL",
+    "{pv_min} <= -0.5",
+    "{feat_seq} contains GGA",
+    "{chr} eq SM_V7_2 && {score_mean} gt 50",
+]
+SORT_COLUMNS = ["score_mean", "pv_min", "chr", "peak_merge_start", "hits_total"]
+# relative frequency of the actions of a session
+ACTIONS = {"filter": 2, "sort": 2, "page": 5, "columns": 1}
+
+log = logging.getLogger("load_test")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "-t",
+        "--tables",
+        default=os.path.join(ROOT, "Tables", "BBB_test.csv"),
+        help="table, directory or manifest to serve",
+    )
+    parser.add_argument("-m", "--modes", nargs="+", choices=MODES, default=MODES)
+    parser.add_argument("-s", "--sessions", type=int, default=8)
+    parser.add_argument(
+        "-d", "--duration", type=float, default=30, help="seconds per mode"
+    )
+    parser.add_argument(
+        "--think",
+        type=float,
+        default=0.0,
+        help="mean pause between the actions of a session, in seconds",
+    )
+    parser.add_argument("-w", "--workers", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("-p", "--port", type=int, default=8051)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--out", default="load_results.json")
+    return parser.parse_args()
+
+
+def server_command(mode, args):
+    if mode == "dev":
+        return [
+            sys.executable,
+            os.path.join(APP_DIR, "app_new.py"),
+            args.tables,
+            "--native-rows",
+            "0",
+        ]
+    gunicorn = shutil.which("gunicorn")
+    if gunicorn is None:
+        return None
+    workers, threads = (1, args.threads) if mode == "threaded" else (args.workers, 1)
+    return [
+        gunicorn,
+        "--chdir",
+        APP_DIR,
+        "-w",
+        str(workers),
+        "--threads",
+        str(threads),
+        "-b",
+        f"{HOST}:{args.port}",
+        "wsgi:server",
+    ]
+
+
+def start_server(mode, args):
+    command = server_command(mode, args)
+    if command is None:
+        return None
+    env = dict(
+        os.environ,
+        PORT=str(args.port),
+        MONSDA_TABLES=os.path.abspath(args.tables),
+        MONSDA_BACKEND="pandas" if mode == "threaded" else "shared",
+        # the sessions click through the server side path, even for small tables
+        MONSDA_NATIVE_ROWS="0",
+    )
+    # own process group, so the reloader / worker children go down with it
+    process = subprocess.Popen(
+        command,
+        env=env,
+        cwd=APP_DIR,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+    deadline = time.time() + STARTUP_TIMEOUT
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{mode} server exited with {process.returncode}")
+        try:
+            conn = http.client.HTTPConnection(HOST, args.port, timeout=5)
+            conn.request("GET", "/_dash-layout")
+            if conn.getresponse().status == 200:
+                return process
+        except OSError:
+            pass
+        time.sleep(0.5)
+    stop_server(process)
+    raise RuntimeError(f"{mode} server did not come up in {STARTUP_TIMEOUT}s")
+
+
+def stop_server(process):
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(10)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def split_prop(name):
+    component, _, prop = name.rpartition(".")
+    return component, prop
+
+
+def output_names(output):
+    return output.strip(".").split("...")
+
+
+class Session:
+    """One simulated analyst, with the component values a browser would hold."""
+
+    def __init__(self, port, rng, think):
+        self.conn = http.client.HTTPConnection(HOST, port, timeout=60)
+        self.rng = rng
+        self.think = think
+        self.values = {}
+        self.timings = []
+
+    def get(self, path):
+        self.conn.request("GET", path)
+        response = self.conn.getresponse()
+        body = response.read()
+        if response.status != 200:
+            raise RuntimeError(f"GET {path}: {response.status}")
+        return json.loads(body)
+
+    def open(self):
+        self.get("/_dash-layout")
+        dependencies = self.get("/_dash-dependencies")
+        # server side callbacks by their outputs
+        self.callbacks = {
+            name: dep
+            for dep in dependencies
+            if not dep.get("clientside_function")
+            for name in output_names(dep["output"])
+        }
+        self.values.update(
+            {
+                "table-selection.value": None,
+                "page-size.value": 20,
+                "table-sorting-filtering.sort_by": [],
+                "table-sorting-filtering.filter_query": "",
+                "region-search.value": None,
+                "table-sorting-filtering.page_current": 0,
+                "page-request.data": None,
+                "page-cache.data": None,
+            }
+        )
+        tables = self.get("/tables/stats")["tables"]
+        self.values["table-selection.value"] = self.rng.choice(sorted(tables))
+        self.fire("open", "column-selection.options", "table-selection.value")
+        self.columns = list(self.values["column-selection.options"])
+        self.fire("open", "page-cache.data", "table-selection.value")
+
+    def fire(self, action, output, changed):
+        """POST the callback that has output, as if changed was just edited."""
+        dep = self.callbacks[output]
+        body = {
+            "output": dep["output"],
+            "outputs": [
+                dict(zip(("id", "property"), split_prop(name)))
+                for name in output_names(dep["output"])
+            ],
+            "inputs": [
+                {**i, "value": self.values.get(f"{i['id']}.{i['property']}")}
+                for i in dep["inputs"]
+            ],
+            "state": [
+                {**s, "value": self.values.get(f"{s['id']}.{s['property']}")}
+                for s in dep["state"]
+            ],
+            "changedPropIds": [changed],
+        }
+        payload = json.dumps(body)
+        start = time.perf_counter()
+        error = None
+        try:
+            self.conn.request(
+                "POST",
+                "/_dash-update-component",
+                payload,
+                {"Content-Type": "application/json"},
+            )
+            response = self.conn.getresponse()
+            data = response.read()
+            if response.status == 200:
+                for component, props in json.loads(data)["response"].items():
+                    for name, value in props.items():
+                        self.values[f"{component}.{name}"] = value
+            elif response.status != 204:
+                error = f"HTTP {response.status}"
+        except (OSError, http.client.HTTPException, ValueError) as e:
+            error = type(e).__name__
+            self.conn.close()
+        self.timings.append((action, time.perf_counter() - start, len(payload), error))
+
+    def act(self):
+        action = self.rng.choices(list(ACTIONS), weights=list(ACTIONS.values()))[0]
+        if action == "filter":
+            self.values["table-sorting-filtering.filter_query"] = self.rng.choice(
+                FILTERS + [""]
+            )
+            changed = "table-sorting-filtering.filter_query"
+        elif action == "sort":
+            sort_by = self.values["table-sorting-filtering.sort_by"]
+            col = self.rng.choice(SORT_COLUMNS)
+            current = next((s for s in sort_by if s["column_id"] == col), None)
+            # none -> asc -> desc -> none, as clicking the sort arrow does
+            if current is None:
+                sort_by = [{"column_id": col, "direction": "asc"}]
+            elif current["direction"] == "asc":
+                sort_by = [{"column_id": col, "direction": "desc"}]
+            else:
+                sort_by = []
+            self.values["table-sorting-filtering.sort_by"] = sort_by
+            changed = "table-sorting-filtering.sort_by"
+        elif action == "page":
+            cache = self.values.get("page-cache.data") or {}
+            total = cache.get("total")
+            if total is None:
+                # a progressive first page, the count is still pending
+                total = (self.values["table-sorting-filtering.page_current"] + 2) * 20
+            last = max((total - 1) // cache.get("size", 20), 0)
+            page = self.values["table-sorting-filtering.page_current"]
+            page = min(max(page + self.rng.choice([-1, 1, 1, 1, 5]), 0), last)
+            self.values["table-sorting-filtering.page_current"] = page
+            self.values["page-request.data"] = {"page": page, "key": cache.get("key")}
+            changed = "page-request.data"
+        else:
+            visible = list(self.values["column-selection.value"])
+            if len(visible) > 5 and self.rng.random() < 0.8:
+                visible.remove(self.rng.choice(visible))
+            else:
+                visible = list(self.columns)
+            self.values["column-selection.value"] = visible
+            changed = "column-selection.value"
+        self.fire(action, "page-cache.data", changed)
+        if action != "page":
+            self.values["table-sorting-filtering.page_current"] = 0
+            self.fire(action, "export-csv.href", changed)
+
+    def run(self, until):
+        try:
+            self.open()
+        except (OSError, http.client.HTTPException, RuntimeError, KeyError) as e:
+            self.timings.append(("open", 0.0, 0, type(e).__name__))
+            return
+        while time.time() < until:
+            self.act()
+            if self.think:
+                time.sleep(self.rng.expovariate(1 / self.think))
+
+
+def summarize(timings, elapsed):
+    latencies = np.array([t for _, t, _, error in timings if error is None])
+    errors = defaultdict(int)
+    for _, _, _, error in timings:
+        if error is not None:
+            errors[error] += 1
+    summary = {
+        "requests": len(timings),
+        "errors": dict(errors),
+        "error_rate": sum(errors.values()) / max(len(timings), 1),
+        "throughput": len(latencies) / elapsed,
+    }
+    if len(latencies):
+        summary.update(
+            {
+                f"p{q}_ms": 1000 * float(np.percentile(latencies, q))
+                for q in (50, 95, 99)
+            }
+        )
+        summary["max_ms"] = 1000 * float(latencies.max())
+    return summary
+
+
+def run_mode(mode, args):
+    process = start_server(mode, args)
+    if process is None:
+        log.warning(f"skipping {mode}: gunicorn is not installed")
+        return None
+    try:
+        until = time.time() + args.duration
+        sessions = [
+            Session(args.port, random.Random(args.seed + i), args.think)
+            for i in range(args.sessions)
+        ]
+        threads = [
+            threading.Thread(target=session.run, args=(until,)) for session in sessions
+        ]
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.time() - start
+    finally:
+        stop_server(process)
+    timings = [t for session in sessions for t in session.timings]
+    result = summarize(timings, elapsed)
+    by_action = defaultdict(list)
+    for timing in timings:
+        by_action[timing[0]].append(timing)
+    result["actions"] = {
+        action: summarize(items, elapsed) for action, items in by_action.items()
+    }
+    log.info(
+        f"{mode:>8}: {result['throughput']:7.1f} req/s "
+        f"p50 {result.get('p50_ms', 0):7.1f}ms p95 {result.get('p95_ms', 0):7.1f}ms "
+        f"p99 {result.get('p99_ms', 0):7.1f}ms errors {result['error_rate']:.1%}"
+    )
+    return result
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    args = parse_args()
+    results = {}
+    for mode in args.modes:
+        result = run_mode(mode, args)
+        if result is not None:
+            results[mode] = result
+    with open(args.out, "w") as fh:
+        json.dump(
+            {
+                "meta": {
+                    "tables": args.tables,
+                    "sessions": args.sessions,
+                    "duration": args.duration,
+                    "think": args.think,
+                    "workers": args.workers,
+                    "threads": args.threads,
+                },
+                "modes": results,
+            },
+            fh,
+            indent=1,
+        )
+    log.info(f"wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -32,6 +32,12 @@ def parse_args():
         action="store",
     )
     parser.add_argument("-u", "--hub", default="hub_393513_genome", action="store")
+    parser.add_argument(
+        "-n",
+        "--no-links",
+        action="store_true",
+        help="do not store the UCSC links, the dashboard builds them from chr/feat_start/feat_end",
+    )
     parser.add_argument("-l", "--loglevel", default="warning", action="store")
     parser.add_argument("-o", "--out_dir", action="store")
 
@@ -143,6 +149,7 @@ def replace_comma_with_newlines(df):
         "minimum_free_energy",
         "links",
     ]
+    c = [col for col in c if col in df.columns]
     df[c] = df[c].replace(",", "\n", regex=True)
 
 
@@ -152,40 +159,44 @@ def rearrange_columns(df):
     print(df.iloc[0])
     df = df[
         [
-            "filter_levels",
-            "chr",
-            "peak_merge_start",
-            "peak_merge_end",
-            "links",
-            "peak_strand",
-            "score_min",
-            "score_max",
-            "score_mean",
-            "score_stdev",
-            "pv_min",
-            "pv_max",
-            "pv_mean",
-            "pv_stdev",
-            "hits_total",
-            "prot",
-            "prot_hits",
-            "cond",
-            "cond_hits",
-            "date",
-            "date_hits",
-            "peak_all_start",
-            "peak_all_end",
-            "feat_start",
-            "feat_end",
-            "feat_name",
-            "feat_strand",
-            "peak_seq",
-            "feat_seq",
-            "sec_structure",
-            "minimum_free_energy",
-            "filter_min",
-            "filter_max",
-            "peak_profile_all",
+            c
+            for c in [
+                "filter_levels",
+                "chr",
+                "peak_merge_start",
+                "peak_merge_end",
+                "links",
+                "peak_strand",
+                "score_min",
+                "score_max",
+                "score_mean",
+                "score_stdev",
+                "pv_min",
+                "pv_max",
+                "pv_mean",
+                "pv_stdev",
+                "hits_total",
+                "prot",
+                "prot_hits",
+                "cond",
+                "cond_hits",
+                "date",
+                "date_hits",
+                "peak_all_start",
+                "peak_all_end",
+                "feat_start",
+                "feat_end",
+                "feat_name",
+                "feat_strand",
+                "peak_seq",
+                "feat_seq",
+                "sec_structure",
+                "minimum_free_energy",
+                "filter_min",
+                "filter_max",
+                "peak_profile_all",
+            ]
+            if c in df.columns
         ]
     ]
     return df
@@ -403,7 +414,8 @@ def main():
         )
         print_pkl_file(DF, args.out_dir)
     set_column_names(DF)
-    add_hublinks(DF, args.hub, args.track_id)
+    if not args.no_links:
+        add_hublinks(DF, args.hub, args.track_id)
     replace_comma_with_newlines(DF)
     DF = rearrange_columns(DF)
     print_tsv_file(DF, args.out_dir)